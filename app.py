@@ -1,11 +1,22 @@
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, make_response, session
+from flask import Flask, render_template, request, jsonify, send_from_directory, flash, redirect, url_for, session, Response, stream_with_context
 import os
 import sys
 from datetime import datetime
 import json
 import csv
-from io import StringIO
-from functools import wraps
+import io
+from itertools import islice
+from functools import cache, wraps
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
 # Add the current directory to the path to import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -14,8 +25,37 @@ from database import DatabaseManager
 from invoice_calculator import InvoiceCalculator, InvoiceValidator
 from pdf_generator import InvoicePDFGenerator
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes responses and decodes request bodies with orjson"""
+    def dumps(self, obj, **kwargs):
+        indent = kwargs.pop('indent', None)
+        kwargs.pop('separators', None)
+        if kwargs:
+            # Options orjson has no equivalent for go through the stdlib encoder
+            return super().dumps(obj, indent=indent, **kwargs)
+        
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        # Parses request.get_json() bodies straight from the raw bytes in C
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'invoice-mgmt-system-2025-change-in-production')  # Change this in production
+# Let nginx stream downloads via X-Sendfile when deployed behind it
+app.use_x_sendfile = os.environ.get('USE_X_SENDFILE', '0') == '1'
+# Internal nginx location aliased to the invoices directory, e.g. /internal-invoices/;
+# when set, downloads are handed to nginx with X-Accel-Redirect
+X_ACCEL_INVOICES_PREFIX = os.environ.get('X_ACCEL_INVOICES_PREFIX', '')
 
 # Determine if running on Vercel
 IS_VERCEL = os.environ.get('VERCEL', '0') == '1'
@@ -27,26 +67,50 @@ db_manager = DatabaseManager(db_name=db_path)
 calculator = InvoiceCalculator()
 pdf_generator = InvoicePDFGenerator()
 
+# Render invoice PDFs off the request thread; filenames stay in the pending
+# set until their job finishes so /download can answer 202 meanwhile
+pdf_executor = ThreadPoolExecutor(max_workers=2)
+pending_pdfs = set()
+pending_pdfs_lock = threading.Lock()
+
+# Runs the independent report queries behind /api/reports/dashboard concurrently
+report_executor = ThreadPoolExecutor(max_workers=4)
+
+def _render_invoice_pdf(invoice_data, pdf_path, pdf_filename):
+    """Generate an invoice PDF and clear its pending marker"""
+    try:
+        pdf_generator.generate_invoice_pdf(invoice_data, pdf_path)
+        app.logger.debug("Invoice %s PDF generated at %s", invoice_data['invoice_number'], pdf_path)
+    except Exception:
+        app.logger.exception("Failed to generate PDF for invoice %s", invoice_data['invoice_number'])
+    finally:
+        with pending_pdfs_lock:
+            pending_pdfs.discard(pdf_filename)
+
 # Authentication decorator
 def login_required(f):
+    # Bind the session proxy and helpers as closure cells rather than globals; session.get itself
+    # cannot be pre-bound here since there is no request context at decoration time
+    _session, _redirect, _url_for = session, redirect, url_for
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return redirect(url_for('login'))
+        if _session.get('user_id') is None:
+            return _redirect(_url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
-# Ensure static and templates directories exist
-if not IS_VERCEL:
-    os.makedirs('static/css', exist_ok=True)
-    os.makedirs('static/js', exist_ok=True)
-    os.makedirs('templates', exist_ok=True)
-    os.makedirs('invoices', exist_ok=True)
-    os.makedirs('uploads', exist_ok=True)  # For CSV uploads
-else:
-    # On Vercel, use /tmp for temporary files
-    os.makedirs('/tmp/invoices', exist_ok=True)
-    os.makedirs('/tmp/uploads', exist_ok=True)
+# Directories the app writes to or serves from (only /tmp is writable on Vercel);
+# CSV uploads are parsed straight from the request, so they need no directory
+RUNTIME_DIRS = ('/tmp/invoices',) if IS_VERCEL else ('static/css', 'static/js', 'templates', 'invoices')
+
+@cache
+def _ensure_dirs():
+    """Create the runtime directories once per process"""
+    for directory in RUNTIME_DIRS:
+        os.makedirs(directory, exist_ok=True)
+
+_ensure_dirs()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -118,12 +182,65 @@ def database_management():
     """Database management page for CSV uploads"""
     return render_template('database_management.html')
 
+# Report periods accepted by the /api/reports endpoints
+VALID_PERIODS = frozenset(('daily', 'weekly', 'monthly'))
+
+def _format_sales_rows(sales_data):
+    """Shape aggregated sales rows for the reports API"""
+    # Rows arrive grouped, averaged and sorted by SQL, so only naming is left
+    return [
+        {
+            'product_name': full_name,
+            'total_quantity': total_quantity,
+            'total_revenue': total_revenue,
+            'times_sold': times_sold,
+            'avg_price': avg_price
+        }
+        for full_name, total_quantity, total_revenue, times_sold, avg_price in sales_data
+    ]
+
+def _format_profit_rows(profit_data):
+    """Shape profit report rows for the reports API"""
+    # Cost, profit and margin already come out of SQL, so only naming is left
+    return [
+        {
+            'product_name': full_name,
+            'total_sold': total_sold,
+            'total_revenue': total_revenue,
+            'total_cost': total_cost,
+            'profit': profit,
+            'profit_margin': profit_margin
+        }
+        for full_name, total_sold, total_revenue, total_cost, profit, profit_margin in profit_data
+    ]
+
+def _format_top_products_rows(top_products):
+    """Shape top selling product rows for the reports API"""
+    result = []
+    for row in top_products:
+        product_name = row[0]
+        weight = row[1] or ''
+        total_sold = row[2]
+        total_revenue = row[3]
+        times_ordered = row[4]
+        
+        full_name = f"{product_name} ({weight})" if weight else product_name
+        
+        result.append({
+            'product_name': full_name,
+            'total_sold': total_sold,
+            'total_revenue': total_revenue,
+            'times_ordered': times_ordered,
+            'avg_quantity_per_order': total_sold / times_ordered if times_ordered > 0 else 0
+        })
+    return result
+
 @app.route('/api/reports/summary/<period>')
 @login_required
 def get_summary_stats_api(period):
     """Get summary statistics for dashboard"""
     try:
-        if period not in ['daily', 'weekly', 'monthly']:
+        if period not in VALID_PERIODS:
             return jsonify({'success': False, 'error': 'Invalid period'}), 400
         
         stats = db_manager.get_summary_stats(period)
@@ -137,46 +254,11 @@ def get_summary_stats_api(period):
 def get_sales_report_api(period):
     """Get sales report for products sold"""
     try:
-        if period not in ['daily', 'weekly', 'monthly']:
+        if period not in VALID_PERIODS:
             return jsonify({'success': False, 'error': 'Invalid period'}), 400
         
-        sales_data = db_manager.get_sales_report_data(period)
-        
-        # Process data to group by product
-        product_sales = {}
-        for row in sales_data:
-            product_name = row[0]
-            weight = row[1] or ''
-            quantity = row[2]
-            unit_price = row[3]
-            total_price = row[4]
-            created_at = row[5]
-            cost_price = row[6] or 0
-            
-            full_name = f"{product_name} ({weight})" if weight else product_name
-            
-            if full_name not in product_sales:
-                product_sales[full_name] = {
-                    'product_name': full_name,
-                    'total_quantity': 0,
-                    'total_revenue': 0,
-                    'times_sold': 0,
-                    'avg_price': 0
-                }
-            
-            product_sales[full_name]['total_quantity'] += quantity
-            product_sales[full_name]['total_revenue'] += total_price
-            product_sales[full_name]['times_sold'] += 1
-        
-        # Calculate average price
-        for product in product_sales.values():
-            if product['total_quantity'] > 0:
-                product['avg_price'] = product['total_revenue'] / product['total_quantity']
-        
-        # Convert to list and sort by quantity
-        result = sorted(product_sales.values(), key=lambda x: x['total_quantity'], reverse=True)
-        
-        return jsonify({'success': True, 'data': result})
+        sales_data = db_manager.get_sales_report_aggregated(period)
+        return jsonify({'success': True, 'data': _format_sales_rows(sales_data)})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -186,33 +268,11 @@ def get_sales_report_api(period):
 def get_profit_report_api(period):
     """Get profit report"""
     try:
-        if period not in ['daily', 'weekly', 'monthly']:
+        if period not in VALID_PERIODS:
             return jsonify({'success': False, 'error': 'Invalid period'}), 400
         
         profit_data = db_manager.get_profit_report(period)
-        
-        result = []
-        for row in profit_data:
-            product_name = row[0]
-            weight = row[1] or ''
-            total_sold = row[2]
-            total_revenue = row[3]
-            avg_cost_price = row[4] or 0
-            total_cost = row[5] or 0
-            profit = row[6] or 0
-            
-            full_name = f"{product_name} ({weight})" if weight else product_name
-            
-            result.append({
-                'product_name': full_name,
-                'total_sold': total_sold,
-                'total_revenue': total_revenue,
-                'total_cost': total_cost,
-                'profit': profit,
-                'profit_margin': (profit / total_revenue * 100) if total_revenue > 0 else 0
-            })
-        
-        return jsonify({'success': True, 'data': result})
+        return jsonify({'success': True, 'data': _format_profit_rows(profit_data)})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -222,43 +282,63 @@ def get_profit_report_api(period):
 def get_top_products_api(period):
     """Get most sold products"""
     try:
-        if period not in ['daily', 'weekly', 'monthly']:
+        if period not in VALID_PERIODS:
             return jsonify({'success': False, 'error': 'Invalid period'}), 400
         
         top_products = db_manager.get_top_selling_products(period, 10)
+        return jsonify({'success': True, 'data': _format_top_products_rows(top_products)})
         
-        result = []
-        for row in top_products:
-            product_name = row[0]
-            weight = row[1] or ''
-            total_sold = row[2]
-            total_revenue = row[3]
-            times_ordered = row[4]
-            
-            full_name = f"{product_name} ({weight})" if weight else product_name
-            
-            result.append({
-                'product_name': full_name,
-                'total_sold': total_sold,
-                'total_revenue': total_revenue,
-                'times_ordered': times_ordered,
-                'avg_quantity_per_order': total_sold / times_ordered if times_ordered > 0 else 0
-            })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reports/dashboard/<period>')
+@login_required
+def get_dashboard_api(period):
+    """Get summary, sales, profit and top products reports in one call"""
+    try:
+        if period not in VALID_PERIODS:
+            return jsonify({'success': False, 'error': 'Invalid period'}), 400
         
-        return jsonify({'success': True, 'data': result})
+        # The queries are independent and each opens its own connection, so run them side by side
+        summary = report_executor.submit(db_manager.get_summary_stats, period)
+        sales = report_executor.submit(db_manager.get_sales_report_aggregated, period)
+        profit = report_executor.submit(db_manager.get_profit_report, period)
+        top_products = report_executor.submit(db_manager.get_top_selling_products, period, 10)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'summary': summary.result(),
+                'sales': _format_sales_rows(sales.result()),
+                'profit': _format_profit_rows(profit.result()),
+                'top_products': _format_top_products_rows(top_products.result())
+            }
+        })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # API Routes
 
+# (products list, encoded body) for the last /api/products response
+_products_json_cache = None
+
 @app.route('/api/products')
 @login_required
 def get_products():
     """Get all products"""
+    global _products_json_cache
     try:
-        products = db_manager.get_all_products()
-        return jsonify({'success': True, 'products': products})
+        # Only encoded, never modified, so the shared cached list is safe to use here
+        products = db_manager.get_all_products(copy=False)
+        
+        # get_all_products(copy=False) hands back the same list until its cache expires
+        # or is invalidated, so the encoded body can be reused for as long as it does
+        cached = _products_json_cache
+        if cached is None or cached[0] is not products:
+            body = app.json.dumps({'success': True, 'products': products}, separators=(',', ':'))
+            cached = _products_json_cache = (products, body)
+        return app.response_class(f"{cached[1]}\n", mimetype='application/json')
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -362,6 +442,40 @@ def mark_as_damaged():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/products/damaged/bulk', methods=['PUT'])
+@login_required
+def mark_as_damaged_bulk():
+    """Mark several products as damaged in one transaction"""
+    try:
+        data = request.get_json()
+        items = []
+        for item in data.get('items', []):
+            full_product_name = item.get('full_product_name', '').strip()
+            damaged_qty = int(item.get('damaged_quantity', 0))
+            
+            if not full_product_name:
+                return jsonify({'success': False, 'error': 'Product name is required'}), 400
+            
+            if damaged_qty <= 0:
+                return jsonify({'success': False, 'error': f'Damaged quantity for "{full_product_name}" must be greater than 0'}), 400
+            
+            items.append((full_product_name, damaged_qty))
+        
+        if not items:
+            return jsonify({'success': False, 'error': 'No items provided'}), 400
+        
+        success, message = db_manager.mark_as_damaged_bulk(items)
+        
+        if success:
+            return jsonify({'success': True, 'message': message})
+        else:
+            return jsonify({'success': False, 'error': message}), 400
+            
+    except ValueError as e:
+        return jsonify({'success': False, 'error': 'Invalid quantity format'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/products/restore', methods=['PUT'])
 @login_required
 def restore_damaged():
@@ -410,40 +524,38 @@ def calculate_invoice():
         if not items_data:
             return jsonify({'success': False, 'error': 'No items provided'}), 400
         
-        # Validate and process items
-        invoice_items = []
+        # Parse each item once, dropping those with missing or invalid values
+        parsed_items = []
         for item_data in items_data:
             try:
                 product_name = item_data.get('product_name', '').strip()
                 quantity = int(item_data.get('quantity', 0))
                 unit_price = float(item_data.get('unit_price', 0))
-                
-                if not product_name or quantity <= 0 or unit_price <= 0:
-                    continue
-                
-                # Check stock availability
-                product = db_manager.get_product(product_name)
-                if not product:
-                    return jsonify({'success': False, 'error': f'Product "{product_name}" not found'}), 400
-                
-                if product['quantity'] < quantity:
-                    return jsonify({'success': False, 'error': f'Insufficient stock for "{product_name}". Available: {product["quantity"]}'}), 400
-                
-                # Get weight from product data
-                weight = product.get('weight', '')
-                
-                # Create invoice item with weight information
-                item = {
-                    'product_name': product_name,
-                    'weight': weight,
-                    'quantity': quantity,
-                    'unit_price': unit_price,
-                    'total_price': quantity * unit_price
-                }
-                invoice_items.append(item)
-                
             except (ValueError, TypeError):
                 continue
+            
+            if not product_name or quantity <= 0 or unit_price <= 0:
+                continue
+            parsed_items.append((product_name, quantity, unit_price))
+        
+        # Look up every referenced product in a single query
+        products = db_manager.get_products_bulk(product_name for product_name, _, _ in parsed_items)
+        
+        # Validate and process items
+        invoice_items = []
+        for product_name, quantity, unit_price in parsed_items:
+            # Check stock availability
+            product = products.get(product_name)
+            if not product:
+                return jsonify({'success': False, 'error': f'Product "{product_name}" not found'}), 400
+            
+            if product['quantity'] < quantity:
+                return jsonify({'success': False, 'error': f'Insufficient stock for "{product_name}". Available: {product["quantity"]}'}), 400
+            
+            # Create invoice item with weight information from product data
+            invoice_items.append(calculator.create_invoice_item(
+                product_name, quantity, unit_price, product.get('weight', '')
+            ))
         
         if not invoice_items:
             return jsonify({'success': False, 'error': 'No valid items to calculate'}), 400
@@ -453,7 +565,7 @@ def calculate_invoice():
         
         return jsonify({
             'success': True,
-            'items': invoice_items,
+            'items': [item.to_dict() for item in invoice_items],
             'totals': totals
         })
         
@@ -465,9 +577,7 @@ def calculate_invoice():
 def generate_invoice():
     """Generate invoice and PDF"""
     try:
-        print("DEBUG: Invoice generation started")
         data = request.get_json()
-        print(f"DEBUG: Received data: {data}")
         
         # Extract customer info
         customer_info = {
@@ -475,12 +585,11 @@ def generate_invoice():
             'phone': data.get('customer_phone', '').strip(),
             'address': data.get('customer_address', '').strip()
         }
-        print(f"DEBUG: Customer info: {customer_info}")
         
         # Validate customer info
         valid, errors = InvoiceValidator.validate_customer_info(customer_info)
         if not valid:
-            print(f"DEBUG: Customer validation failed: {errors}")
+            app.logger.debug("Customer validation failed: %s", errors)
             return jsonify({'success': False, 'error': '; '.join(errors)}), 400
         
         # Extract items
@@ -493,12 +602,15 @@ def generate_invoice():
         if not valid:
             return jsonify({'success': False, 'error': '; '.join(errors)}), 400
         
-        # Check stock for all items first
+        # Check stock for all items first, fetching every product in one query
+        products = db_manager.get_products_bulk(
+            item_data.get('product_name', '').strip() for item_data in items_data
+        )
         for item_data in items_data:
             product_name = item_data.get('product_name', '').strip()
             quantity = int(item_data.get('quantity', 0))
             
-            product = db_manager.get_product(product_name)
+            product = products.get(product_name)
             if not product:
                 return jsonify({'success': False, 'error': f'Product "{product_name}" not found'}), 400
             
@@ -508,14 +620,13 @@ def generate_invoice():
         # Create complete invoice
         invoice_data = calculator.create_complete_invoice(customer_info, items_data)
         
-        # Reduce stock for all items
-        for item_data in items_data:
-            product_name = item_data.get('product_name', '').strip()
-            quantity = int(item_data.get('quantity', 0))
-            
-            success, message = db_manager.reduce_stock(product_name, quantity)
-            if not success:
-                return jsonify({'success': False, 'error': message}), 400
+        # Reduce stock for all items in a single transaction
+        success, message = db_manager.reduce_stock_bulk(
+            (item_data.get('product_name', '').strip(), int(item_data.get('quantity', 0)))
+            for item_data in items_data
+        )
+        if not success:
+            return jsonify({'success': False, 'error': message}), 400
         
         # Save invoice to database
         success, message = db_manager.save_invoice(invoice_data, invoice_data['items'])
@@ -526,9 +637,16 @@ def generate_invoice():
         pdf_filename = f"invoice_{invoice_data['invoice_number']}.pdf"
         invoices_dir = '/tmp/invoices' if IS_VERCEL else 'invoices'
         pdf_path = os.path.join(invoices_dir, pdf_filename)
-        print(f"DEBUG: Generating PDF at: {pdf_path}")
-        pdf_generator.generate_invoice_pdf(invoice_data, pdf_path)
-        print(f"DEBUG: PDF generated successfully")
+        if IS_VERCEL:
+            # Serverless instances may be frozen once the response is sent,
+            # so background jobs are not guaranteed to finish there
+            _render_invoice_pdf(invoice_data, pdf_path, pdf_filename)
+            pdf_available = True
+        else:
+            with pending_pdfs_lock:
+                pending_pdfs.add(pdf_filename)
+            pdf_executor.submit(_render_invoice_pdf, invoice_data, pdf_path, pdf_filename)
+            pdf_available = False
         
         # Return invoice data for display instead of PDF download
         response_data = {
@@ -541,16 +659,15 @@ def generate_invoice():
                 'customer_name': invoice_data['customer_name'],
                 'customer_phone': invoice_data['customer_phone'],
                 'customer_address': invoice_data['customer_address'],
-                'items': invoice_data['items'],
+                'items': [item.to_dict() for item in invoice_data['items']],
                 'subtotal': invoice_data['subtotal'],
-                'cgst_amount': invoice_data['cgst_amount'],
-                'sgst_amount': invoice_data['sgst_amount'],
+                'cgst_amount': invoice_data.get('cgst_amount', 0),
+                'sgst_amount': invoice_data.get('sgst_amount', 0),
                 'total_amount': invoice_data['total_amount']
             },
-            'pdf_available': True,
+            'pdf_available': pdf_available,
             'pdf_url': f'/download/{pdf_filename}'
         }
-        print(f"DEBUG: Sending response: {response_data}")
         
         return jsonify(response_data)
         
@@ -562,12 +679,25 @@ def generate_invoice():
 def download_file(filename):
     """Download generated PDF"""
     try:
-        invoices_dir = '/tmp/invoices' if IS_VERCEL else 'invoices'
-        pdf_path = os.path.join(invoices_dir, filename)
-        if os.path.exists(pdf_path):
-            return send_file(pdf_path, as_attachment=True)
-        else:
-            return jsonify({'error': 'File not found'}), 404
+        invoices_dir = os.path.abspath('/tmp/invoices' if IS_VERCEL else 'invoices')
+        with pending_pdfs_lock:
+            pending = filename in pending_pdfs
+        if pending:
+            return jsonify({'status': 'pending', 'message': 'PDF is still being generated'}), 202
+        if X_ACCEL_INVOICES_PREFIX:
+            redirect_path = safe_join(X_ACCEL_INVOICES_PREFIX, filename)
+            if redirect_path is None:
+                return jsonify({'error': 'File not found'}), 404
+            # nginx serves the file (and answers 404 itself), freeing this worker immediately
+            return Response(headers={
+                'X-Accel-Redirect': redirect_path,
+                'Content-Type': 'application/pdf',
+                'Content-Disposition': f'attachment; filename="{filename}"'
+            })
+        # send_from_directory guards against traversal and opens the file once, raising NotFound if absent
+        return send_from_directory(invoices_dir, filename, as_attachment=True, conditional=True)
+    except NotFound:
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -578,49 +708,52 @@ def get_invoices():
     # This would require extending the database manager to fetch invoices
     return jsonify({'success': True, 'invoices': []})
 
+class _EchoBuffer:
+    """File-like object whose write() hands the value back, letting csv.writer format single rows"""
+    def write(self, value):
+        return value
+
 @app.route('/api/products/export')
 @login_required
 def export_products():
     """Export all products to CSV"""
     try:
-        products = db_manager.get_all_products()
-        
-        # Create CSV content
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Product Name', 'Quantity', 'Selling Price (₹)', 'Status', 'Last Updated'])
-        
-        # Write data
-        for product in products:
-            # Determine status
-            if product['quantity'] == 0:
-                status = 'Out of Stock'
-            elif product['quantity'] <= 10:
-                status = 'Low Stock'
-            else:
-                status = 'In Stock'
+        def generate_rows():
+            """Yield the CSV one formatted line at a time"""
+            # csv.writer returns whatever the buffer's write() returns, i.e. the formatted line
+            writer = csv.writer(_EchoBuffer())
             
-            # Format updated date
-            updated_at = product.get('updated_at', 'N/A')
-            if updated_at and updated_at != 'N/A':
-                try:
-                    updated_at = datetime.fromisoformat(updated_at).strftime('%Y-%m-%d')
-                except:
-                    updated_at = 'N/A'
+            # Write header
+            yield writer.writerow(['Product Name', 'Quantity', 'Selling Price (₹)', 'Status', 'Last Updated'])
             
-            writer.writerow([
-                product['product_name'],
-                product['quantity'],
-                f"₹{product['selling_price']:.2f}",
-                status,
-                updated_at
-            ])
-        
-        # Create response
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
+            # Write data, reading products in batches as the response is sent
+            for product in db_manager.iter_products():
+                # Determine status
+                if product['quantity'] == 0:
+                    status = 'Out of Stock'
+                elif product['quantity'] <= 10:
+                    status = 'Low Stock'
+                else:
+                    status = 'In Stock'
+                
+                # Format updated date; SQLite timestamps start with YYYY-MM-DD, so slice instead of parsing
+                updated_at = product.get('updated_at', 'N/A')
+                if updated_at and updated_at != 'N/A':
+                    if isinstance(updated_at, str) and len(updated_at) >= 10 and updated_at[4] == '-' and updated_at[7] == '-':
+                        updated_at = updated_at[:10]
+                    else:
+                        updated_at = 'N/A'
+                
+                yield writer.writerow([
+                    product['product_name'],
+                    product['quantity'],
+                    f"₹{product['selling_price']:.2f}",
+                    status,
+                    updated_at
+                ])
+        
+        # Stream the response instead of building the whole file in memory
+        response = Response(stream_with_context(generate_rows()), mimetype='text/csv')
         response.headers['Content-Disposition'] = f'attachment; filename=stock_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
         
         return response
@@ -643,29 +776,18 @@ def upload_csv():
         if not file.filename.endswith('.csv'):
             return jsonify({'success': False, 'error': 'Please upload a CSV file'}), 400
         
-        # Save uploaded file
-        uploads_dir = '/tmp/uploads' if IS_VERCEL else 'uploads'
-        upload_path = os.path.join(uploads_dir, 'uploaded_data.csv')
-        file.save(upload_path)
-        
         # Import the rebuild functionality
         from rebuild_database_v2 import DatabaseRebuilderV2
         
-        # Create rebuilder with uploaded file
-        rebuilder = DatabaseRebuilderV2(csv_file=upload_path)
-        
-        # Backup existing database
-        rebuilder.backup_old_database()
+        # Parse the upload straight from the request stream instead of saving it to disk first
+        rebuilder = DatabaseRebuilderV2(db_name=db_manager.db_name, csv_stream=file.stream)
         
-        # Create new database
-        rebuilder.create_new_database()
-        
-        # Import CSV data
-        success = rebuilder.import_csv_data()
+        # Rebuild into a staging file, then back up and swap; the live database is untouched on failure.
+        # Every pooled connection is closed, and new checkouts wait, while the file is swapped and the
+        # rebuilt file, which has no users table or damaged_quantity column yet, is migrated
+        success = rebuilder.rebuild_database(swap_guard=db_manager.pause_connections())
         
         if success:
-            # Clean up uploaded file
-            os.remove(upload_path)
             return jsonify({
                 'success': True, 
                 'message': 'Database updated successfully!',
@@ -689,22 +811,21 @@ def preview_csv():
         if file.filename == '':
             return jsonify({'success': False, 'error': 'No file selected'}), 400
         
-        # Read CSV content
-        stream = StringIO(file.read().decode('utf-8-sig'))
+        # Decode the upload incrementally rather than reading it all into memory
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
         csv_reader = csv.DictReader(stream)
         
         # Get first 5 rows as preview
-        preview_data = []
-        for i, row in enumerate(csv_reader):
-            if i >= 5:  # Limit to 5 rows
-                break
-            preview_data.append(dict(row))
+        preview_data = [dict(row) for row in islice(csv_reader, 5)]
+        
+        # Count the remaining rows without building dicts for them
+        total_rows = len(preview_data) + sum(1 for row in csv_reader.reader if row)
         
         return jsonify({
             'success': True,
             'columns': csv_reader.fieldnames,
             'preview': preview_data,
-            'total_rows': i + 1
+            'total_rows': total_rows
         })
         
     except Exception as e:
@@ -720,11 +841,6 @@ def internal_error(error):
     return render_template('500.html'), 500
 
 if __name__ == '__main__':
-    # Create invoices directory if it doesn't exist
-    if not IS_VERCEL:
-        if not os.path.exists('invoices'):
-            os.makedirs('invoices')
-    
     print("Starting Invoice Generation System Web Application...")
     print("Access the application at: http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
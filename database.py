@@ -1,18 +1,220 @@
 import sqlite3
 import os
 import hashlib
-from datetime import datetime
+import hmac
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 class DatabaseManager:
+    # Seconds a cached product lookup stays valid; writes through this manager invalidate it sooner
+    PRODUCT_CACHE_TTL = 30
+    # Maximum number of individual products kept by the get_product cache
+    PRODUCT_CACHE_SIZE = 256
+    # Seconds a cached get_summary_stats result may be served while the data looks unchanged
+    STATS_CACHE_TTL = 30
+    # scrypt cost parameters for new password hashes (~16 MB and tens of ms per hash)
+    SCRYPT_N = 2 ** 14
+    SCRYPT_R = 8
+    SCRYPT_P = 1
+    # Idle connections kept open for reuse; busier moments open extra ones that are closed on return
+    POOL_SIZE = 5
+    # Seconds pause_connections waits for checked-out connections to come back
+    DRAIN_TIMEOUT = 30
+    # Stored in PRAGMA user_version once init_database has created and migrated the schema;
+    # bump it whenever init_database gains a new table, column or index
+    SCHEMA_VERSION = 3
+    # Prepared statements each pooled connection keeps; its SQL (period variants included) fits easily
+    CACHED_STATEMENTS = 256
+    # Rows iter_products pulls from SQLite per fetchmany() call
+    FETCH_BATCH_SIZE = 200
+    # Days covered by each report period, counting today; daily is just today
+    PERIOD_DAYS = {'daily': 1, 'weekly': 8, 'monthly': 31}
+    # Applied to every new connection: WAL lets readers run alongside the single writer and, with
+    # synchronous=NORMAL, commits no longer fsync each time; the rest keeps hot pages in memory.
+    # WAL ties its -wal/-shm files to the open database file, so only replace it on disk
+    # inside pause_connections, as the CSV upload's rebuild does
+    CONNECTION_PRAGMAS = '''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA cache_size=-20000;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA foreign_keys=ON;
+    '''
+    
     def __init__(self, db_name="invoice_system.db"):
         self.db_name = db_name
+        self._cache_lock = threading.Lock()
+        self._all_products_cache = None  # (expires_at, products)
+        self._product_cache = OrderedDict()  # full_product_name -> (expires_at, product)
+        self._stats_cache = {}  # period -> (expires_at, fingerprint, stats)
+        self._stats_generation = 0
+        self._pool = queue.LifoQueue(maxsize=self.POOL_SIZE)
+        self._pool_lock = threading.Lock()
+        # Notified whenever a checked-out connection comes back or a pause ends
+        self._pool_changed = threading.Condition(self._pool_lock)
+        self._pool_generation = 0
+        self._connection_generations = {}  # connection -> pool generation it was opened in
+        self._data_versions = {}  # connection -> PRAGMA data_version get_summary_stats last read on it
+        self._checked_out = 0
+        self._pool_paused = False
         self.init_database()
     
+    def _create_connection(self):
+        """Open a new connection that may be handed between threads by the pool"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=self.CACHED_STATEMENTS)
+        # Rows can be read by column name as well as by position, and dict(row) is built in C
+        conn.row_factory = sqlite3.Row
+        conn.executescript(self.CONNECTION_PRAGMAS)
+        return conn
+    
+    def _get_connection(self):
+        """Take an idle pooled connection, opening a new one if none is free"""
+        with self._pool_changed:
+            # Wait out a pause_connections block, e.g. while the database file is swapped
+            while self._pool_paused:
+                self._pool_changed.wait()
+            self._checked_out += 1
+        
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        
+        try:
+            conn = self._create_connection()
+        except Exception:
+            self._release_checkout()
+            raise
+        with self._pool_lock:
+            self._connection_generations[conn] = self._pool_generation
+        return conn
+    
+    def _release_checkout(self):
+        """Count a checked-out connection as returned and wake anyone draining the pool"""
+        with self._pool_changed:
+            self._checked_out -= 1
+            self._pool_changed.notify_all()
+    
+    def _recycle_connection(self, conn):
+        """Put a returned connection back in the pool, or close it if it is stale or the pool is full"""
+        try:
+            # Never let a half-finished transaction (e.g. an UPDATE that matched nothing) leak to the next user
+            if conn.in_transaction:
+                conn.rollback()
+            
+            with self._pool_lock:
+                current = self._connection_generations.get(conn) == self._pool_generation
+            if current:
+                self._pool.put_nowait(conn)
+                return
+        except (queue.Full, sqlite3.Error):
+            pass
+        
+        with self._pool_lock:
+            self._connection_generations.pop(conn, None)
+            self._data_versions.pop(conn, None)
+        conn.close()
+    
+    def _return_connection(self, conn):
+        """Hand a connection back to the pool, closing it if it is stale or the pool is full"""
+        try:
+            self._recycle_connection(conn)
+        finally:
+            self._release_checkout()
+    
+    @contextmanager
+    def pause_connections(self, timeout=None):
+        """Close every connection and hold off new ones for the duration of the block.
+        
+        Waits up to timeout (DRAIN_TIMEOUT by default) seconds for checked-out connections
+        to come back, raising TimeoutError if they do not. Use it around anything that
+        replaces the database file, so no WAL connection stays open on the old one. When
+        the block completes, the file is migrated to the current schema and cached lookups
+        are dropped before new checkouts resume.
+        """
+        with self._pool_changed:
+            self._pool_paused = True
+            drained = self._pool_changed.wait_for(
+                lambda: self._checked_out == 0,
+                self.DRAIN_TIMEOUT if timeout is None else timeout
+            )
+        try:
+            if not drained:
+                raise TimeoutError("Timed out waiting for database connections to be returned")
+            self.reset_connections()
+            yield
+            
+            # A replacement file may lack tables the app needs (e.g. users); checkouts would
+            # wait on the pause, so migrate over a connection of its own
+            conn = self._create_connection()
+            try:
+                self._create_schema(conn)
+            finally:
+                conn.close()
+            self.invalidate_product_cache()
+        finally:
+            with self._pool_changed:
+                self._pool_paused = False
+                self._pool_changed.notify_all()
+    
+    def reset_connections(self):
+        """Close pooled connections, e.g. after the database file was replaced on disk"""
+        with self._pool_lock:
+            # Connections checked out right now are closed when they are returned
+            self._pool_generation += 1
+        
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            with self._pool_lock:
+                self._connection_generations.pop(conn, None)
+                self._data_versions.pop(conn, None)
+            conn.close()
+    
+    def invalidate_product_cache(self):
+        """Drop cached product lookups after the products table changes"""
+        with self._cache_lock:
+            self._all_products_cache = None
+            self._product_cache.clear()
+        # Summary stats include stock and damage totals
+        self.invalidate_stats_cache()
+    
+    def invalidate_stats_cache(self):
+        """Drop cached summary stats after invoices or products change"""
+        with self._cache_lock:
+            # Results computed before this point must not be stored once they finish
+            self._stats_generation += 1
+            self._stats_cache.clear()
+    
     def init_database(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
+        try:
+            self._create_schema(conn)
+        finally:
+            # Also rolls back a setup that failed part way
+            self._return_connection(conn)
+    
+    def _create_schema(self, conn):
+        """Create and migrate the schema up to SCHEMA_VERSION"""
         cursor = conn.cursor()
         
+        # Schema already at the current version: nothing to create or migrate
+        if self._schema_version(cursor) >= self.SCHEMA_VERSION:
+            return
+        
+        # Hold the write lock for the whole setup so workers starting together migrate only once
+        cursor.execute('BEGIN IMMEDIATE')
+        if self._schema_version(cursor) >= self.SCHEMA_VERSION:
+            return
+        
         # Create products table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS products (
@@ -30,11 +232,19 @@ class DatabaseManager:
         ''')
         
         # Add damaged_quantity column if it doesn't exist (for existing databases)
-        try:
+        cursor.execute('PRAGMA table_info(products)')
+        if 'damaged_quantity' not in {column['name'] for column in cursor.fetchall()}:
             cursor.execute('ALTER TABLE products ADD COLUMN damaged_quantity INTEGER DEFAULT 0')
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
+        
+        # Create customers table; invoices keep the contact details they were issued with
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS customers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                phone TEXT,
+                address TEXT
+            )
+        ''')
         
         # Create invoices table
         cursor.execute('''
@@ -48,10 +258,27 @@ class DatabaseManager:
                 cgst_amount REAL NOT NULL,
                 sgst_amount REAL NOT NULL,
                 total_amount REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                customer_id INTEGER,
+                FOREIGN KEY (customer_id) REFERENCES customers (id)
             )
         ''')
         
+        # Add customer_id for existing databases, creating a customer per distinct name
+        # with the contact details from that customer's latest invoice
+        cursor.execute('PRAGMA table_info(invoices)')
+        if 'customer_id' not in {column['name'] for column in cursor.fetchall()}:
+            cursor.execute('ALTER TABLE invoices ADD COLUMN customer_id INTEGER REFERENCES customers (id)')
+            cursor.execute('''
+                INSERT OR IGNORE INTO customers (name, phone, address)
+                SELECT customer_name, customer_phone, customer_address FROM invoices
+                WHERE id IN (SELECT MAX(id) FROM invoices GROUP BY customer_name)
+            ''')
+            cursor.execute('''
+                UPDATE invoices 
+                SET customer_id = (SELECT id FROM customers WHERE name = invoices.customer_name)
+            ''')
+        
         # Create invoice_items table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS invoice_items (
@@ -62,10 +289,28 @@ class DatabaseManager:
                 quantity INTEGER NOT NULL,
                 unit_price REAL NOT NULL,
                 total_price REAL NOT NULL,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+                product_id INTEGER,
+                FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+                FOREIGN KEY (product_id) REFERENCES products (id)
             )
         ''')
         
+        # Add product_id for existing databases and link their past items by name
+        cursor.execute('PRAGMA table_info(invoice_items)')
+        if 'product_id' not in {column['name'] for column in cursor.fetchall()}:
+            cursor.execute('ALTER TABLE invoice_items ADD COLUMN product_id INTEGER REFERENCES products (id)')
+            cursor.execute('''
+                UPDATE invoice_items 
+                SET product_id = (SELECT id FROM products WHERE full_product_name = invoice_items.product_name)
+            ''')
+        
+        # Index the columns the invoice joins and report date filters look up
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_invoice_id ON invoice_items(invoice_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_product_name ON invoice_items(product_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_product_id ON invoice_items(product_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_customer_id ON invoices(customer_id)')
+        
         # Create users table for authentication
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -92,17 +337,36 @@ class DatabaseManager:
             ''', ("admin", password_hash, "admin@company.com", "Administrator"))
             print(f"Default admin user created. Username: admin, Password: {default_password}")
         
+        cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
         conn.commit()
-        conn.close()
         print("Database initialized successfully!")
     
+    def _schema_version(self, cursor):
+        """Read the schema version init_database last stamped into the database file"""
+        cursor.execute('PRAGMA user_version')
+        return cursor.fetchone()[0]
+    
     def _hash_password(self, password):
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with a random salt using scrypt"""
+        salt = os.urandom(16)
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=self.SCRYPT_N, r=self.SCRYPT_R, p=self.SCRYPT_P)
+        return f"scrypt${self.SCRYPT_N}${self.SCRYPT_R}${self.SCRYPT_P}${salt.hex()}${digest.hex()}"
+    
+    def _verify_password(self, password, password_hash):
+        """Check a password against a stored hash, returning (matches, needs_rehash)"""
+        if password_hash.startswith('scrypt$'):
+            _, n, r, p, salt, digest = password_hash.split('$')
+            candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p))
+            matches = hmac.compare_digest(candidate.hex(), digest)
+            return matches, (int(n), int(r), int(p)) != (self.SCRYPT_N, self.SCRYPT_R, self.SCRYPT_P)
+        
+        # Unsalted SHA-256 digest from before scrypt; upgraded on the next successful login
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, password_hash), True
     
     def create_user(self, username, password, email=None, full_name=None):
         """Create a new user"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
@@ -118,28 +382,35 @@ class DatabaseManager:
         except Exception as e:
             return False, f"Error creating user: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def authenticate_user(self, username, password):
         """Authenticate user login"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
-            password_hash = self._hash_password(password)
             cursor.execute('''
-                SELECT id, username, email, full_name, is_active 
+                SELECT id, username, email, full_name, is_active, password_hash 
                 FROM users 
-                WHERE username = ? AND password_hash = ? AND is_active = 1
-            ''', (username, password_hash))
+                WHERE username = ? AND is_active = 1
+            ''', (username,))
             
             user = cursor.fetchone()
-            if user:
-                # Update last login time
-                cursor.execute('''
-                    UPDATE users SET last_login = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                ''', (user[0],))
+            matches, needs_rehash = self._verify_password(password, user[5]) if user else (False, False)
+            if matches:
+                if needs_rehash:
+                    # Move legacy or outdated hashes to the current scheme while we have the password
+                    cursor.execute('''
+                        UPDATE users SET password_hash = ?, last_login = CURRENT_TIMESTAMP 
+                        WHERE id = ?
+                    ''', (self._hash_password(password), user[0]))
+                else:
+                    # Update last login time
+                    cursor.execute('''
+                        UPDATE users SET last_login = CURRENT_TIMESTAMP 
+                        WHERE id = ?
+                    ''', (user[0],))
                 conn.commit()
                 
                 return True, {
@@ -155,11 +426,11 @@ class DatabaseManager:
             print(f"Authentication error: {str(e)}")
             return False, None
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def get_user_by_id(self, user_id):
         """Get user details by ID"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
@@ -170,25 +441,17 @@ class DatabaseManager:
             
             user = cursor.fetchone()
             if user:
-                return {
-                    'id': user[0],
-                    'username': user[1],
-                    'email': user[2],
-                    'full_name': user[3],
-                    'created_at': user[4],
-                    'last_login': user[5],
-                    'is_active': user[6]
-                }
+                return dict(user)
             return None
         except Exception as e:
             print(f"Error getting user: {str(e)}")
             return None
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def add_product(self, product_name, quantity, selling_price, weight=None, cost_price=0):
         """Add a new product to the database"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         # Create full product name
@@ -203,70 +466,126 @@ class DatabaseManager:
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (product_name, weight, full_product_name, quantity, cost_price, selling_price))
             conn.commit()
+            self.invalidate_product_cache()
             return True, "Product added successfully!"
         except sqlite3.IntegrityError:
             return False, "Product already exists!"
         except Exception as e:
             return False, f"Error: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
+    
+    def _row_to_product(self, result):
+        """Convert a products row into a product dictionary"""
+        # Map by column name: schemas from init_database and the CSV rebuild order columns differently
+        product = dict(result)
+        # Rebuilt databases have no damaged_quantity column
+        product.setdefault('damaged_quantity', 0)
+        return product
+    
+    def _load_product(self, full_product_name):
+        """Read a product straight from the database, bypassing the cache"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM products WHERE full_product_name = ?
+            ''', (full_product_name,))
+            result = cursor.fetchone()
+        finally:
+            self._return_connection(conn)
+        
+        if result:
+            return self._row_to_product(result)
+        return None
     
     def get_product(self, full_product_name):
         """Get product details by full product name (includes weight)"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        with self._cache_lock:
+            cached = self._product_cache.get(full_product_name)
+            if cached and cached[0] > time.monotonic():
+                self._product_cache.move_to_end(full_product_name)
+                # Hand out a copy so callers cannot edit the cached entry
+                return dict(cached[1])
         
-        cursor.execute('''
-            SELECT * FROM products WHERE full_product_name = ?
-        ''', (full_product_name,))
+        product = self._load_product(full_product_name)
+        if product:
+            with self._cache_lock:
+                self._product_cache[full_product_name] = (time.monotonic() + self.PRODUCT_CACHE_TTL, product)
+                self._product_cache.move_to_end(full_product_name)
+                if len(self._product_cache) > self.PRODUCT_CACHE_SIZE:
+                    self._product_cache.popitem(last=False)
+            return dict(product)
+        return product
+    
+    def get_products_bulk(self, full_product_names):
+        """Get product details for several full product names in one query, keyed by full product name"""
+        names = list(dict.fromkeys(full_product_names))
+        if not names:
+            return {}
         
-        result = cursor.fetchone()
-        conn.close()
+        placeholders = ', '.join('?' * len(names))
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT * FROM products WHERE full_product_name IN ({placeholders})
+            ''', names)
+            results = cursor.fetchall()
+        finally:
+            self._return_connection(conn)
         
-        if result:
-            return {
-                'id': result[0],
-                'product_name': result[1],
-                'weight': result[2],
-                'full_product_name': result[3],
-                'quantity': result[4],
-                'cost_price': result[5],
-                'selling_price': result[6],
-                'created_at': result[7],
-                'updated_at': result[8],
-                'damaged_quantity': result[9] if len(result) > 9 else 0
-            }
-        return None
+        products = {}
+        for result in results:
+            product = self._row_to_product(result)
+            products[product['full_product_name']] = product
+        return products
     
-    def get_all_products(self):
-        """Get all products from database"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def get_all_products(self, copy=True):
+        """Get all products from database, served from a short-lived cache when fresh.
         
-        cursor.execute('SELECT * FROM products ORDER BY product_name, weight')
-        results = cursor.fetchall()
-        conn.close()
+        Returns copies of the cached products; copy=False hands back the shared cached
+        list itself, which the caller must treat as read-only.
+        """
+        with self._cache_lock:
+            cached = self._all_products_cache
+            if cached and cached[0] > time.monotonic():
+                products = cached[1]
+            else:
+                products = None
         
-        products = []
-        for result in results:
-            products.append({
-                'id': result[0],
-                'product_name': result[1],
-                'weight': result[2],
-                'full_product_name': result[3],
-                'quantity': result[4],
-                'cost_price': result[5],
-                'selling_price': result[6],
-                'created_at': result[7],
-                'updated_at': result[8],
-                'damaged_quantity': result[9] if len(result) > 9 else 0
-            })
+        if products is None:
+            products = list(self.iter_products())
+            with self._cache_lock:
+                self._all_products_cache = (time.monotonic() + self.PRODUCT_CACHE_TTL, products)
         
+        if copy:
+            return [dict(product) for product in products]
         return products
     
+    def iter_products(self, limit=None, offset=0):
+        """Yield products in name order, fetching FETCH_BATCH_SIZE rows at a time"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.arraysize = self.FETCH_BATCH_SIZE
+            # LIMIT -1 means no limit in SQLite
+            cursor.execute('''
+                SELECT * FROM products ORDER BY product_name, weight LIMIT ? OFFSET ?
+            ''', (-1 if limit is None else limit, offset))
+            
+            while True:
+                results = cursor.fetchmany()
+                if not results:
+                    break
+                for result in results:
+                    yield self._row_to_product(result)
+        finally:
+            self._return_connection(conn)
+    
     def update_product_quantity(self, full_product_name, new_quantity):
         """Update product quantity using full product name"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
@@ -278,29 +597,84 @@ class DatabaseManager:
             
             if cursor.rowcount > 0:
                 conn.commit()
+                self.invalidate_product_cache()
                 return True, "Product quantity updated successfully!"
             else:
                 return False, "Product not found!"
         except Exception as e:
             return False, f"Error: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def reduce_stock(self, full_product_name, quantity_sold):
         """Reduce stock after sale using full product name"""
-        product = self.get_product(full_product_name)
-        if not product:
-            return False, "Product not found!"
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            # Check and decrement in one statement so concurrent sales cannot oversell
+            cursor.execute('''
+                UPDATE products 
+                SET quantity = quantity - ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE full_product_name = ? AND quantity >= ?
+            ''', (quantity_sold, full_product_name, quantity_sold))
+            
+            if cursor.rowcount == 0:
+                conn.rollback()
+                if self._product_exists(cursor, full_product_name):
+                    return False, "Insufficient stock!"
+                return False, "Product not found!"
+            
+            conn.commit()
+            self.invalidate_product_cache()
+            return True, "Product quantity updated successfully!"
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+        finally:
+            self._return_connection(conn)
+    
+    def _product_exists(self, cursor, full_product_name):
+        """Tell a missing product apart from a failed stock guard after an UPDATE matched nothing"""
+        cursor.execute('SELECT 1 FROM products WHERE full_product_name = ?', (full_product_name,))
+        return cursor.fetchone() is not None
+    
+    def reduce_stock_bulk(self, items):
+        """Reduce stock for several (full_product_name, quantity_sold) pairs in one transaction"""
+        # Combine repeated products so each row is checked against its total sold quantity
+        totals = {}
+        for full_product_name, quantity_sold in items:
+            totals[full_product_name] = totals.get(full_product_name, 0) + quantity_sold
+        
+        if not totals:
+            return True, "Stock updated successfully!"
         
-        if product['quantity'] < quantity_sold:
-            return False, "Insufficient stock!"
+        conn = self._get_connection()
+        cursor = conn.cursor()
         
-        new_quantity = product['quantity'] - quantity_sold
-        return self.update_product_quantity(full_product_name, new_quantity)
+        try:
+            # The quantity guard makes each UPDATE a no-op when stock is insufficient
+            cursor.executemany('''
+                UPDATE products 
+                SET quantity = quantity - ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE full_product_name = ? AND quantity >= ?
+            ''', [(quantity, name, quantity) for name, quantity in totals.items()])
+            
+            if cursor.rowcount != len(totals):
+                conn.rollback()
+                return False, "Insufficient stock or product not found!"
+            
+            conn.commit()
+            self.invalidate_product_cache()
+            return True, "Stock updated successfully!"
+        except Exception as e:
+            conn.rollback()
+            return False, f"Error: {str(e)}"
+        finally:
+            self._return_connection(conn)
     
     def update_damaged_quantity(self, full_product_name, damaged_quantity):
         """Update damaged quantity for a product"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
@@ -312,103 +686,144 @@ class DatabaseManager:
             
             if cursor.rowcount > 0:
                 conn.commit()
+                self.invalidate_product_cache()
                 return True, "Damaged quantity updated successfully!"
             else:
                 return False, "Product not found!"
         except Exception as e:
             return False, f"Error: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def mark_as_damaged(self, full_product_name, damaged_qty):
         """Mark products as damaged, reducing available stock and increasing damaged count"""
-        product = self.get_product(full_product_name)
-        if not product:
-            return False, "Product not found!"
-        
-        if product['quantity'] < damaged_qty:
-            return False, "Not enough stock to mark as damaged!"
+        return self._move_stock(
+            full_product_name, damaged_qty, -damaged_qty, 'quantity',
+            "Not enough stock to mark as damaged!",
+            "Marked {qty} units as damaged. Available: {available}, Damaged: {damaged}"
+        )
+    
+    def restore_damaged(self, full_product_name, restore_qty):
+        """Restore damaged products back to available stock"""
+        return self._move_stock(
+            full_product_name, restore_qty, restore_qty, 'damaged_quantity',
+            "Not enough damaged stock to restore!",
+            "Restored {qty} units from damaged. Available: {available}, Damaged: {damaged}"
+        )
+    
+    def _move_stock(self, full_product_name, qty, quantity_change, guarded_column, shortage_message, success_message):
+        """Move qty units between available and damaged stock in one guarded UPDATE.
         
-        conn = sqlite3.connect(self.db_name)
+        quantity_change is added to quantity and subtracted from damaged_quantity;
+        guarded_column is the side being drawn down, which must hold at least qty.
+        """
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
-            # Reduce regular quantity and increase damaged quantity
-            new_quantity = product['quantity'] - damaged_qty
-            new_damaged_quantity = product['damaged_quantity'] + damaged_qty
+            cursor.execute(f'''
+                UPDATE products 
+                SET quantity = quantity + ?, damaged_quantity = damaged_quantity - ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE full_product_name = ? AND {guarded_column} >= ?
+            ''', (quantity_change, quantity_change, full_product_name, qty))
             
+            if cursor.rowcount == 0:
+                conn.rollback()
+                if self._product_exists(cursor, full_product_name):
+                    return False, shortage_message
+                return False, "Product not found!"
+            
+            # Still inside the write transaction, so this reads exactly what the UPDATE left
             cursor.execute('''
-                UPDATE products 
-                SET quantity = ?, damaged_quantity = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE full_product_name = ?
-            ''', (new_quantity, new_damaged_quantity, full_product_name))
+                SELECT quantity, damaged_quantity FROM products WHERE full_product_name = ?
+            ''', (full_product_name,))
+            available, damaged = cursor.fetchone()
             
             conn.commit()
-            return True, f"Marked {damaged_qty} units as damaged. Available: {new_quantity}, Damaged: {new_damaged_quantity}"
+            self.invalidate_product_cache()
+            return True, success_message.format(qty=qty, available=available, damaged=damaged)
         except Exception as e:
             return False, f"Error: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
     
-    def restore_damaged(self, full_product_name, restore_qty):
-        """Restore damaged products back to available stock"""
-        product = self.get_product(full_product_name)
-        if not product:
-            return False, "Product not found!"
+    def mark_as_damaged_bulk(self, items):
+        """Mark several (full_product_name, damaged_qty) pairs as damaged in one transaction"""
+        return self._move_stock_bulk(
+            items, -1, 'quantity', "Not enough stock to mark as damaged: {names}",
+            "Marked {qty} units across {count} products as damaged"
+        )
+    
+    def restore_damaged_bulk(self, items):
+        """Restore several (full_product_name, restore_qty) pairs from damaged stock in one transaction"""
+        return self._move_stock_bulk(
+            items, 1, 'damaged_quantity', "Not enough damaged stock to restore: {names}",
+            "Restored {qty} units across {count} products from damaged"
+        )
+    
+    def _move_stock_bulk(self, items, direction, guarded_column, shortage_message, success_message):
+        """Apply _move_stock's guarded UPDATE to many products, committing only if every one succeeds.
         
-        if product['damaged_quantity'] < restore_qty:
-            return False, "Not enough damaged stock to restore!"
+        direction is +1 to move units into available stock and -1 to move them out.
+        """
+        # Combine repeated products so each row is checked against its total quantity
+        totals = {}
+        for full_product_name, qty in items:
+            totals[full_product_name] = totals.get(full_product_name, 0) + qty
         
-        conn = sqlite3.connect(self.db_name)
+        if not totals:
+            return True, success_message.format(qty=0, count=0)
+        
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
-            # Increase regular quantity and reduce damaged quantity
-            new_quantity = product['quantity'] + restore_qty
-            new_damaged_quantity = product['damaged_quantity'] - restore_qty
+            # Same SQL text for every item, so each execute reuses the cached statement;
+            # running them one at a time tells us exactly which products fell short
+            failed = []
+            for full_product_name, qty in totals.items():
+                cursor.execute(f'''
+                    UPDATE products 
+                    SET quantity = quantity + ?, damaged_quantity = damaged_quantity - ?, updated_at = CURRENT_TIMESTAMP 
+                    WHERE full_product_name = ? AND {guarded_column} >= ?
+                ''', (direction * qty, direction * qty, full_product_name, qty))
+                if cursor.rowcount == 0:
+                    failed.append(full_product_name)
             
-            cursor.execute('''
-                UPDATE products 
-                SET quantity = ?, damaged_quantity = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE full_product_name = ?
-            ''', (new_quantity, new_damaged_quantity, full_product_name))
+            if failed:
+                conn.rollback()
+                missing = [name for name in failed if not self._product_exists(cursor, name)]
+                if missing:
+                    return False, f"Product not found: {', '.join(missing)}"
+                return False, shortage_message.format(names=', '.join(failed))
             
             conn.commit()
-            return True, f"Restored {restore_qty} units from damaged. Available: {new_quantity}, Damaged: {new_damaged_quantity}"
+            self.invalidate_product_cache()
+            return True, success_message.format(qty=sum(totals.values()), count=len(totals))
         except Exception as e:
+            conn.rollback()
             return False, f"Error: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def get_damaged_products_report(self):
         """Get all products with damaged quantities"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
+            # Columns are aliased to the report's field names and the lost value is computed in SQL
             cursor.execute('''
-                SELECT product_name, weight, full_product_name, quantity, damaged_quantity, 
-                       cost_price, selling_price, updated_at
+                SELECT product_name, weight, full_product_name, 
+                       quantity AS available_quantity, damaged_quantity, 
+                       cost_price, selling_price, 
+                       damaged_quantity * cost_price AS total_value_lost, updated_at
                 FROM products 
                 WHERE damaged_quantity > 0
                 ORDER BY damaged_quantity DESC, product_name
             ''')
             
-            results = cursor.fetchall()
-            
-            damaged_products = []
-            for result in results:
-                damaged_products.append({
-                    'product_name': result[0],
-                    'weight': result[1],
-                    'full_product_name': result[2],
-                    'available_quantity': result[3],
-                    'damaged_quantity': result[4],
-                    'cost_price': result[5],
-                    'selling_price': result[6],
-                    'total_value_lost': result[4] * result[5],  # damaged_qty * cost_price
-                    'updated_at': result[7]
-                })
+            damaged_products = [dict(result) for result in cursor.fetchall()]
             
             return damaged_products
             
@@ -416,50 +831,89 @@ class DatabaseManager:
             print(f"Error getting damaged products report: {str(e)}")
             return []
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def save_invoice(self, invoice_data, invoice_items):
         """Save invoice to database"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
+            # Take the write lock up front so the invoice and its items commit together, without
+            # another writer slipping in between or a deferred read lock needing an upgrade
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            # Record the customer, keeping their latest contact details
+            cursor.execute('''
+                INSERT INTO customers (name, phone, address) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET phone = excluded.phone, address = excluded.address
+            ''', (
+                invoice_data['customer_name'],
+                invoice_data['customer_phone'],
+                invoice_data['customer_address']
+            ))
+            
             # Insert invoice
             cursor.execute('''
                 INSERT INTO invoices (invoice_number, customer_name, customer_phone, 
-                                    customer_address, subtotal, cgst_amount, sgst_amount, total_amount)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                    customer_address, subtotal, cgst_amount, sgst_amount, total_amount, customer_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT id FROM customers WHERE name = ?))
             ''', (
                 invoice_data['invoice_number'],
                 invoice_data['customer_name'],
                 invoice_data['customer_phone'],
                 invoice_data['customer_address'],
                 invoice_data['subtotal'],
-                invoice_data['cgst_amount'],
-                invoice_data['sgst_amount'],
-                invoice_data['total_amount']
+                # GST is included in selling prices, so invoices carry no separate GST amounts
+                invoice_data.get('cgst_amount', 0),
+                invoice_data.get('sgst_amount', 0),
+                invoice_data['total_amount'],
+                invoice_data['customer_name']
             ))
             
+            # lastrowid is read off the connection after the INSERT, no extra statement needed
             invoice_id = cursor.lastrowid
             
-            # Insert invoice items
-            for item in invoice_items:
-                cursor.execute('''
-                    INSERT INTO invoice_items (invoice_id, product_name, weight, quantity, unit_price, total_price)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (invoice_id, item['product_name'], item.get('weight', ''), item['quantity'], item['unit_price'], item['total_price']))
+            # Insert all invoice items with one prepared statement, linking each to its product
+            # row so reports join on the integer key rather than comparing names
+            cursor.executemany('''
+                INSERT INTO invoice_items (invoice_id, product_name, weight, quantity, unit_price, total_price, product_id)
+                VALUES (?, ?, ?, ?, ?, ?, (SELECT id FROM products WHERE full_product_name = ?))
+            ''', [
+                (invoice_id, item.product_name, item.weight or '', item.quantity, item.unit_price, item.total_price, item.product_name)
+                for item in invoice_items
+            ])
             
             conn.commit()
+            self.invalidate_stats_cache()
             return True, "Invoice saved successfully!"
         except Exception as e:
             conn.rollback()
             return False, f"Error saving invoice: {str(e)}"
         finally:
-            conn.close()
+            self._return_connection(conn)
+    
+    def _period_filter(self, period, column='i.created_at'):
+        """Build the WHERE clause and its bindings restricting a timestamp column to a report period.
+        
+        The bounds are bound date strings rather than date(column), so SQLite can
+        range-seek the created_at index instead of calling date() on every row, and
+        every period shares one SQL string that the statement cache can reuse. Report
+        joins list invoices first with CROSS JOIN, which SQLite keeps as the outer loop,
+        so the seek drives the join even before ANALYZE has gathered any statistics.
+        """
+        days = self.PERIOD_DAYS.get(period)
+        if days is None:
+            return "", []
+        
+        # created_at holds CURRENT_TIMESTAMP, which is UTC, so the day boundaries are UTC too
+        tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+        start = tomorrow - timedelta(days=days)
+        return f"WHERE {column} >= ? AND {column} < ?", [start.isoformat(), tomorrow.isoformat()]
     
     def get_sales_report_data(self, period='daily', start_date=None, end_date=None):
         """Get sales report data for specified period"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
@@ -473,23 +927,20 @@ class DatabaseManager:
                     ii.total_price,
                     i.created_at,
                     p.cost_price
-                FROM invoice_items ii
-                JOIN invoices i ON ii.invoice_id = i.id
-                LEFT JOIN products p ON ii.product_name = p.full_product_name
+                FROM invoices i
+                CROSS JOIN invoice_items ii ON ii.invoice_id = i.id
+                LEFT JOIN products p ON p.id = ii.product_id
             '''
             
             params = []
             
             # Add date filtering
             if start_date and end_date:
-                base_query += " WHERE date(i.created_at) BETWEEN ? AND ?"
+                base_query += " WHERE i.created_at >= date(?) AND i.created_at < date(?, '+1 day')"
                 params = [start_date, end_date]
-            elif period == 'daily':
-                base_query += " WHERE date(i.created_at) = date('now')"
-            elif period == 'weekly':
-                base_query += " WHERE date(i.created_at) >= date('now', '-7 days')"
-            elif period == 'monthly':
-                base_query += " WHERE date(i.created_at) >= date('now', '-30 days')"
+            elif period in self.PERIOD_DAYS:
+                date_filter, params = self._period_filter(period)
+                base_query += " " + date_filter
             
             base_query += " ORDER BY i.created_at DESC"
             
@@ -502,40 +953,76 @@ class DatabaseManager:
             print(f"Error getting sales report data: {str(e)}")
             return []
         finally:
-            conn.close()
+            self._return_connection(conn)
+    
+    def get_sales_report_aggregated(self, period='daily'):
+        """Get per-product sales totals for specified period, aggregated in SQL"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            date_filter, params = self._period_filter(period)
+            
+            query = f'''
+                SELECT 
+                    CASE WHEN COALESCE(ii.weight, '') != ''
+                         THEN ii.product_name || ' (' || ii.weight || ')'
+                         ELSE ii.product_name END as full_name,
+                    SUM(ii.quantity) as total_quantity,
+                    SUM(ii.total_price) as total_revenue,
+                    COUNT(*) as times_sold,
+                    CASE WHEN SUM(ii.quantity) > 0
+                         THEN SUM(ii.total_price) * 1.0 / SUM(ii.quantity)
+                         ELSE 0 END as avg_price
+                FROM invoices i
+                CROSS JOIN invoice_items ii ON ii.invoice_id = i.id
+                {date_filter}
+                GROUP BY full_name
+                ORDER BY total_quantity DESC, MAX(i.created_at) DESC
+            '''
+            
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            
+            return results
+            
+        except Exception as e:
+            print(f"Error getting aggregated sales report: {str(e)}")
+            return []
+        finally:
+            self._return_connection(conn)
     
     def get_profit_report(self, period='daily'):
         """Get profit report for specified period"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
-            date_filter = ""
-            if period == 'daily':
-                date_filter = "WHERE date(i.created_at) = date('now')"
-            elif period == 'weekly':
-                date_filter = "WHERE date(i.created_at) >= date('now', '-7 days')"
-            elif period == 'monthly':
-                date_filter = "WHERE date(i.created_at) >= date('now', '-30 days')"
+            date_filter, params = self._period_filter(period)
             
+            # Cost, profit and margin are computed per group in SQL; products missing from the
+            # catalogue count as zero cost and profit but still sort after every known profit
             query = f'''
                 SELECT 
-                    ii.product_name,
-                    ii.weight,
+                    CASE WHEN COALESCE(ii.weight, '') != ''
+                         THEN ii.product_name || ' (' || ii.weight || ')'
+                         ELSE ii.product_name END as full_name,
                     SUM(ii.quantity) as total_sold,
                     SUM(ii.total_price) as total_revenue,
-                    AVG(p.cost_price) as avg_cost_price,
-                    SUM(ii.quantity * p.cost_price) as total_cost,
-                    SUM(ii.total_price) - SUM(ii.quantity * p.cost_price) as profit
-                FROM invoice_items ii
-                JOIN invoices i ON ii.invoice_id = i.id
-                LEFT JOIN products p ON ii.product_name = p.full_product_name
+                    COALESCE(SUM(ii.quantity * p.cost_price), 0) as total_cost,
+                    COALESCE(SUM(ii.total_price) - SUM(ii.quantity * p.cost_price), 0) as profit,
+                    CASE WHEN SUM(ii.total_price) > 0
+                         THEN COALESCE(SUM(ii.total_price) - SUM(ii.quantity * p.cost_price), 0) * 100.0 / SUM(ii.total_price)
+                         ELSE 0 END as profit_margin
+                FROM invoices i
+                CROSS JOIN invoice_items ii ON ii.invoice_id = i.id
+                LEFT JOIN products p ON p.id = ii.product_id
                 {date_filter}
                 GROUP BY ii.product_name, ii.weight
-                ORDER BY profit DESC
+                ORDER BY SUM(ii.total_price) - SUM(ii.quantity * p.cost_price) DESC
             '''
             
-            cursor.execute(query)
+            cursor.execute(query, params)
             results = cursor.fetchall()
             
             return results
@@ -544,21 +1031,15 @@ class DatabaseManager:
             print(f"Error getting profit report: {str(e)}")
             return []
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def get_top_selling_products(self, period='monthly', limit=10):
         """Get most sold products for specified period"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
-            date_filter = ""
-            if period == 'daily':
-                date_filter = "WHERE date(i.created_at) = date('now')"
-            elif period == 'weekly':
-                date_filter = "WHERE date(i.created_at) >= date('now', '-7 days')"
-            elif period == 'monthly':
-                date_filter = "WHERE date(i.created_at) >= date('now', '-30 days')"
+            date_filter, params = self._period_filter(period)
             
             query = f'''
                 SELECT 
@@ -567,15 +1048,15 @@ class DatabaseManager:
                     SUM(ii.quantity) as total_sold,
                     SUM(ii.total_price) as total_revenue,
                     COUNT(DISTINCT i.id) as times_ordered
-                FROM invoice_items ii
-                JOIN invoices i ON ii.invoice_id = i.id
+                FROM invoices i
+                CROSS JOIN invoice_items ii ON ii.invoice_id = i.id
                 {date_filter}
                 GROUP BY ii.product_name, ii.weight
                 ORDER BY total_sold DESC
                 LIMIT ?
             '''
             
-            cursor.execute(query, [limit])
+            cursor.execute(query, params + [limit])
             results = cursor.fetchall()
             
             return results
@@ -584,63 +1065,66 @@ class DatabaseManager:
             print(f"Error getting top selling products: {str(e)}")
             return []
         finally:
-            conn.close()
+            self._return_connection(conn)
     
     def get_summary_stats(self, period='monthly'):
-        """Get summary statistics for dashboard"""
-        conn = sqlite3.connect(self.db_name)
+        """Get summary statistics for dashboard, reusing a recent result while the data is unchanged"""
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         try:
-            date_filter = ""
-            if period == 'daily':
-                date_filter = "WHERE date(created_at) = date('now')"
-            elif period == 'weekly':
-                date_filter = "WHERE date(created_at) >= date('now', '-7 days')"
-            elif period == 'monthly':
-                date_filter = "WHERE date(created_at) >= date('now', '-30 days')"
-            
-            # Total invoices
-            cursor.execute(f"SELECT COUNT(*) FROM invoices {date_filter}")
-            total_invoices = cursor.fetchone()[0]
-            
-            # Total revenue
-            cursor.execute(f"SELECT COALESCE(SUM(total_amount), 0) FROM invoices {date_filter}")
-            total_revenue = cursor.fetchone()[0]
-            
-            # Total products sold
+            date_filter, params = self._period_filter(period, 'created_at')
+            
+            # Writes through this manager clear the cache. data_version changes whenever another
+            # connection commits, so it also catches writes from other processes sharing the
+            # database file; it is only comparable with the value last read on the same
+            # connection, and a connection that has not read it before cannot vouch for the cache
+            cursor.execute('PRAGMA data_version')
+            data_version = cursor.fetchone()[0]
+            with self._pool_lock:
+                last_seen = self._data_versions.get(conn)
+                self._data_versions[conn] = data_version
+            if last_seen != data_version:
+                self.invalidate_stats_cache()
+            
+            # The period bounds move at midnight
+            fingerprint = tuple(params)
+            with self._cache_lock:
+                generation = self._stats_generation
+                cached = self._stats_cache.get(period)
+                if cached and cached[0] > time.monotonic() and cached[1] == fingerprint:
+                    return cached[2]
+            
+            # All seven figures in one statement: invoices in the period are filtered once
+            # and each table is aggregated in a single pass. The LEFT JOIN keeps items whose
+            # product no longer exists in the quantity sold; their NULL profit terms are
+            # skipped by SUM, as the inner join used to skip them
             cursor.execute(f'''
-                SELECT COALESCE(SUM(ii.quantity), 0) 
-                FROM invoice_items ii 
-                JOIN invoices i ON ii.invoice_id = i.id 
-                {date_filter.replace('created_at', 'i.created_at') if date_filter else ''}
-            ''')
-            total_products_sold = cursor.fetchone()[0]
-            
-            # Total damaged products
-            cursor.execute("SELECT COALESCE(SUM(damaged_quantity), 0) FROM products")
-            total_damaged_products = cursor.fetchone()[0]
-            
-            # Total value of damaged products
-            cursor.execute("SELECT COALESCE(SUM(damaged_quantity * cost_price), 0) FROM products WHERE damaged_quantity > 0")
-            damaged_value = cursor.fetchone()[0]
-            
-            # Unique customers
-            cursor.execute(f"SELECT COUNT(DISTINCT customer_name) FROM invoices {date_filter}")
-            unique_customers = cursor.fetchone()[0]
-            
-            # Total profit calculation
-            profit_query = f'''
-                SELECT COALESCE(SUM(ii.quantity * (ii.unit_price - p.cost_price)), 0) as total_profit
-                FROM invoice_items ii 
-                JOIN invoices i ON ii.invoice_id = i.id 
-                JOIN products p ON ii.product_name = p.full_product_name 
-                {date_filter.replace('created_at', 'i.created_at') if date_filter else ''}
-            '''
-            cursor.execute(profit_query)
-            total_profit = cursor.fetchone()[0] or 0
+                WITH inv AS (
+                    SELECT id, total_amount, customer_id FROM invoices {date_filter}
+                )
+                SELECT invoice_stats.*, item_stats.*, damage_stats.*
+                FROM (
+                    SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COUNT(DISTINCT customer_id)
+                    FROM inv
+                ) AS invoice_stats, (
+                    SELECT COALESCE(SUM(ii.quantity), 0),
+                           COALESCE(SUM(ii.quantity * (ii.unit_price - p.cost_price)), 0)
+                    FROM invoice_items ii
+                    JOIN inv ON ii.invoice_id = inv.id
+                    LEFT JOIN products p ON p.id = ii.product_id
+                ) AS item_stats, (
+                    SELECT COALESCE(SUM(damaged_quantity), 0),
+                           COALESCE(SUM(CASE WHEN damaged_quantity > 0 THEN damaged_quantity * cost_price END), 0)
+                    FROM products
+                ) AS damage_stats
+            ''', params)
+            (total_invoices, total_revenue, unique_customers,
+             total_products_sold, total_profit,
+             total_damaged_products, damaged_value) = cursor.fetchone()
+            total_profit = total_profit or 0
             
-            return {
+            stats = {
                 'total_invoices': total_invoices,
                 'total_revenue': total_revenue,
                 'total_profit': total_profit,
@@ -649,6 +1133,10 @@ class DatabaseManager:
                 'damaged_value': damaged_value,
                 'unique_customers': unique_customers
             }
+            with self._cache_lock:
+                if self._stats_generation == generation:
+                    self._stats_cache[period] = (time.monotonic() + self.STATS_CACHE_TTL, fingerprint, stats)
+            return stats
             
         except Exception as e:
             print(f"Error getting summary stats: {str(e)}")
@@ -662,7 +1150,7 @@ class DatabaseManager:
                 'unique_customers': 0
             }
         finally:
-            conn.close()
+            self._return_connection(conn)
 
 if __name__ == "__main__":
     # Initialize database and add sample data
@@ -1,5 +1,54 @@
-from datetime import datetime
-import uuid
+from dataclasses import dataclass
+from operator import attrgetter
+from time import localtime, strftime
+import re
+import secrets
+
+def to_paise(amount):
+    """Convert a rupee amount to whole paise"""
+    return round(amount * 100)
+
+@dataclass
+class InvoiceItem:
+    """A single invoice line with its calculated total.
+    
+    Amounts are held as integer paise so totals add up exactly; the rupee
+    properties convert back only where prices are displayed or stored.
+    """
+    # Slots by hand: dataclass(slots=True) needs Python 3.10 and deployments still run 3.9
+    __slots__ = ('product_name', 'quantity', 'unit_price_paise', 'total_price_paise', 'weight')
+    product_name: str
+    quantity: int
+    unit_price_paise: int
+    total_price_paise: int
+    weight: str
+    
+    @property
+    def unit_price(self):
+        return self.unit_price_paise / 100
+    
+    @property
+    def total_price(self):
+        return self.total_price_paise / 100
+    
+    def to_dict(self):
+        """Convert the item into a dictionary for JSON responses"""
+        return {
+            'product_name': self.product_name,
+            'weight': self.weight,
+            'quantity': self.quantity,
+            'unit_price': self.unit_price,
+            'total_price': self.total_price
+        }
+
+_total_price_paise = attrgetter('total_price_paise')
+
+# strftime formats for invoice numbers and for the invoice's date and time
+_INVOICE_NUMBER_TIME_FORMAT = "%Y%m%d%H%M%S"
+_INVOICE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Phone numbers are 6 to 15 digits (15 is the longest E.164 number)
+_PHONE_RE = re.compile(r'[0-9]{6,15}')
 
 class InvoiceCalculator:
     def __init__(self):
@@ -9,67 +58,60 @@ class InvoiceCalculator:
         """
         pass
     
-    def generate_invoice_number(self):
-        """Generate unique invoice number"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        unique_id = str(uuid.uuid4())[:6].upper()
+    def generate_invoice_number(self, now=None):
+        """Generate unique invoice number, timestamped with now (a time.struct_time, default: the current time)"""
+        # time.strftime formats straight from the struct_time, with no datetime object in between
+        timestamp = strftime(_INVOICE_NUMBER_TIME_FORMAT, now or localtime())
+        unique_id = secrets.token_hex(3).upper()
         return f"INV-{timestamp}-{unique_id}"
     
     def calculate_item_total(self, unit_price, quantity):
         """Calculate total for a single item"""
-        return round(unit_price * quantity, 2)
+        return to_paise(unit_price) * quantity / 100
     
     def calculate_subtotal(self, items):
         """Calculate total amount (prices already include GST)"""
-        total = sum(item['total_price'] for item in items)
-        return round(total, 2)
+        # Integer paise add up exactly, so no rounding is needed; map + attrgetter
+        # keeps the loop in C instead of resuming a generator per item
+        return sum(map(_total_price_paise, items)) / 100
     
     def calculate_total_amount(self, subtotal):
         """Calculate final total amount (no additional GST)"""
-        return round(subtotal, 2)
+        return subtotal
     
-    def create_invoice_item(self, product_name, quantity, unit_price):
+    def create_invoice_item(self, product_name, quantity, unit_price, weight=''):
         """Create an invoice item with calculations"""
-        total_price = self.calculate_item_total(unit_price, quantity)
+        unit_price_paise = to_paise(unit_price)
         
-        return {
-            'product_name': product_name,
-            'quantity': quantity,
-            'unit_price': unit_price,
-            'total_price': total_price
-        }
+        return InvoiceItem(product_name, quantity, unit_price_paise, unit_price_paise * quantity, weight)
     
     def calculate_invoice_totals(self, items):
         """Calculate invoice totals (no GST since already included in prices)"""
         total_amount = self.calculate_subtotal(items)
         
+        # No GST fields: they would always be zero, and readers default them to 0
         return {
             'subtotal': total_amount,
-            'cgst_rate': 0,
-            'sgst_rate': 0,
-            'cgst_amount': 0,
-            'sgst_amount': 0,
-            'total_gst_rate': 0,
             'total_amount': total_amount
         }
     
     def create_complete_invoice(self, customer_info, items_data):
         """Create a complete invoice with all calculations (no GST since included in prices)"""
+        # Read the clock once so the invoice number, date and time all agree
+        now = localtime()
+        date, time = strftime(_INVOICE_DATETIME_FORMAT, now).split(" ")
+        
         # Generate invoice number
-        invoice_number = self.generate_invoice_number()
+        invoice_number = self.generate_invoice_number(now)
         
         # Create invoice items with calculations
-        invoice_items = []
-        for item_data in items_data:
-            item = self.create_invoice_item(
-                item_data['product_name'],
-                item_data['quantity'],
-                item_data['unit_price']
-            )
-            invoice_items.append(item)
+        invoice_items = [
+            self.create_invoice_item(item_data['product_name'], item_data['quantity'], item_data['unit_price'])
+            for item_data in items_data
+        ]
         
-        # Calculate totals
-        totals = self.calculate_invoice_totals(invoice_items)
+        # Calculate totals (no GST since included in prices, so subtotal is the total)
+        total_amount = self.calculate_subtotal(invoice_items)
         
         # Create complete invoice data
         invoice_data = {
@@ -77,10 +119,11 @@ class InvoiceCalculator:
             'customer_name': customer_info.get('name', ''),
             'customer_phone': customer_info.get('phone', ''),
             'customer_address': customer_info.get('address', ''),
-            'date': datetime.now().strftime("%Y-%m-%d"),
-            'time': datetime.now().strftime("%H:%M:%S"),
+            'date': date,
+            'time': time,
             'items': invoice_items,
-            **totals
+            'subtotal': total_amount,
+            'total_amount': total_amount
         }
         
         return invoice_data
@@ -97,8 +140,8 @@ class InvoiceValidator:
             errors.append("Customer name is required")
         
         phone = customer_info.get('phone', '').strip()
-        if phone and not phone.isdigit():
-            errors.append("Phone number should contain only digits")
+        if phone and not _PHONE_RE.fullmatch(phone):
+            errors.append("Phone number should be 6 to 15 digits")
         
         return len(errors) == 0, errors
     
@@ -159,10 +202,8 @@ if __name__ == "__main__":
     print(f"Date: {invoice['date']} {invoice['time']}")
     print("\n=== ITEMS ===")
     for item in invoice['items']:
-        print(f"{item['product_name']}: {item['quantity']} x ₹{item['unit_price']} = ₹{item['total_price']}")
+        print(f"{item.product_name}: {item.quantity} x ₹{item.unit_price} = ₹{item.total_price}")
     
     print(f"\n=== TOTALS ===")
     print(f"Subtotal: ₹{invoice['subtotal']}")
-    print(f"CGST ({invoice['cgst_rate']}%): ₹{invoice['cgst_amount']}")
-    print(f"SGST ({invoice['sgst_rate']}%): ₹{invoice['sgst_amount']}")
     print(f"Total Amount: ₹{invoice['total_amount']}")
\ No newline at end of file
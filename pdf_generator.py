@@ -1,11 +1,207 @@
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch, mm
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import cache
+from types import SimpleNamespace
+import io
 import os
+import warnings
+
+# Formats an amount as rupees with thousands separators, e.g. ₹1,234.50
+_format_rupees = '₹{:,.2f}'.format
+
+# Table fonts. Helvetica is one of the 14 PDF core fonts: reportlab reads its AFM metrics
+# once and embeds nothing, so PDFs pay no per-document font subsetting. Switching to a TTF
+# name means registering it once in _pdf_styles with pdfmetrics.registerFont, never per invoice
+_BODY_FONT = 'Helvetica'
+_BOLD_FONT = 'Helvetica-Bold'
+
+# Fixed table rows, shared by every PDF; reportlab only reads them
+_ITEMS_HEADER = ('S.No.', 'Product Name', 'Quantity', 'Unit Price (₹)', 'Total (₹)')
+_EMPTY_ROW = ('', '')
+
+@cache
+def _pdf_styles():
+    """Import reportlab and build the paragraph and table styles on first use.
+    
+    reportlab is deliberately not imported at module level: it takes over 100 ms to
+    load, which app start-up would otherwise pay before any PDF is requested. The
+    styles are then shared by every generator and PDF; reportlab only reads them
+    while building a document.
+    """
+    # Import reportlab and check its C accelerator
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+    from reportlab.lib.rl_accel import _py_funcs as _rl_python_fallbacks
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    
+    # Text measurement and escaping run far slower without the rl_accel C extension
+    if _rl_python_fallbacks:
+        warnings.warn(
+            "reportlab C accelerator (_rl_accel) not found; PDFs will build slowly. "
+            "Install it with: pip install 'reportlab[accel]'",
+            RuntimeWarning
+        )
+    
+    styles = getSampleStyleSheet()
+    
+    # Company name style
+    company_name_style = ParagraphStyle(
+        'CompanyName',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#2E3440'),
+        alignment=TA_CENTER,
+        spaceAfter=6
+    )
+    
+    # Company details style
+    company_details_style = ParagraphStyle(
+        'CompanyDetails',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor("#CA6826"),
+        alignment=TA_CENTER,
+        spaceAfter=20
+    )
+    
+    # Invoice title style
+    invoice_title_style = ParagraphStyle(
+        'InvoiceTitle',
+        parent=styles['Heading2'],
+        fontSize=18,
+        textColor=colors.HexColor('#CA6826'),
+        alignment=TA_CENTER,
+        spaceAfter=20
+    )
+    
+    # Section heading style
+    section_heading_style = ParagraphStyle(
+        'SectionHeading',
+        parent=styles['Heading3'],
+        fontSize=12,
+        textColor=colors.HexColor('#CA6826'),
+        spaceBefore=10,
+        spaceAfter=6
+    )
+    
+    # Normal text style
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#2E3440')
+    )
+    
+    # Right aligned style
+    right_align_style = ParagraphStyle(
+        'RightAlign',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#2E3440'),
+        alignment=TA_RIGHT
+    )
+    
+    # Footer thank you message style
+    thank_you_style = ParagraphStyle(
+        'ThankYou',
+        parent=styles['Normal'],
+        fontSize=12,
+        textColor=colors.HexColor('#5E81AC'),
+        alignment=TA_CENTER,
+        spaceBefore=10,
+        spaceAfter=10
+    )
+    
+    # Footer terms and conditions style
+    terms_style = ParagraphStyle(
+        'Terms',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=colors.HexColor('#4C566A'),
+        alignment=TA_CENTER
+    )
+    
+    # Invoice number and date table styling
+    invoice_details_style = TableStyle([
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), _BOLD_FONT),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2E3440')),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ])
+    
+    # Items table styling
+    items_table_style = TableStyle([
+        # Header styling
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5E81AC')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), _BOLD_FONT),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('TOPPADDING', (0, 0), (-1, 0), 12),
+        
+        # Data styling
+        ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # S.No.
+        ('ALIGN', (1, 1), (1, -1), 'LEFT'),    # Product name
+        ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Quantity
+        ('ALIGN', (3, 1), (3, -1), 'RIGHT'),   # Unit price
+        ('ALIGN', (4, 1), (4, -1), 'RIGHT'),   # Total
+    
+        ('FONTNAME', (0, 1), (-1, -1), _BODY_FONT),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#2E3440')),
+        
+        # Grid and borders
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#D8DEE9')),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F8F9FA')]),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ])
+    
+    # Totals table styling (no GST since included in prices)
+    totals_table_style = TableStyle([
+        # Regular rows
+        ('ALIGN', (0, 0), (0, 2), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, 2), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, 2), _BODY_FONT),
+        ('FONTSIZE', (0, 0), (-1, 2), 10),
+        ('TEXTCOLOR', (0, 0), (-1, 2), colors.HexColor('#2E3440')),
+        ('BOTTOMPADDING', (0, 0), (-1, 2), 4),
+        
+        # Total row styling
+        ('ALIGN', (0, 4), (-1, 4), 'RIGHT'),
+        ('FONTNAME', (0, 4), (-1, 4), _BOLD_FONT),
+        ('FONTSIZE', (0, 4), (-1, 4), 12),
+        ('TEXTCOLOR', (0, 4), (-1, 4), colors.HexColor('#5E81AC')),
+        ('TOPPADDING', (0, 4), (-1, 4), 8),
+        ('BOTTOMPADDING', (0, 4), (-1, 4), 8),
+        
+        # Border for total row
+        ('LINEABOVE', (0, 4), (-1, 4), 2, colors.HexColor('#5E81AC')),
+    ])
+    
+    return SimpleNamespace(
+        company_name_style=company_name_style,
+        company_details_style=company_details_style,
+        invoice_title_style=invoice_title_style,
+        section_heading_style=section_heading_style,
+        normal_style=normal_style,
+        right_align_style=right_align_style,
+        thank_you_style=thank_you_style,
+        terms_style=terms_style,
+        invoice_details_style=invoice_details_style,
+        items_table_style=items_table_style,
+        totals_table_style=totals_table_style
+    )
+    
+def _generate_pdf_worker(job):
+    """Build one invoice PDF inside a worker process"""
+    company_info, invoice_data, filename = job
+    return InvoicePDFGenerator(company_info).generate_invoice_pdf(invoice_data, filename)
 
 class InvoicePDFGenerator:
     def __init__(self, company_info=None):
@@ -18,76 +214,30 @@ class InvoicePDFGenerator:
             'gstin': '37ESVPM9846R1Z1'
         }
         
-        self.styles = getSampleStyleSheet()
-        self._create_custom_styles()
-    
-    def _create_custom_styles(self):
-        """Create custom paragraph styles"""
-        # Company name style
-        self.company_name_style = ParagraphStyle(
-            'CompanyName',
-            parent=self.styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#2E3440'),
-            alignment=TA_CENTER,
-            spaceAfter=6
-        )
-        
-        # Company details style
-        self.company_details_style = ParagraphStyle(
-            'CompanyDetails',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor("#CA6826"),
-            alignment=TA_CENTER,
-            spaceAfter=20
-        )
-        
-        # Invoice title style
-        self.invoice_title_style = ParagraphStyle(
-            'InvoiceTitle',
-            parent=self.styles['Heading2'],
-            fontSize=18,
-            textColor=colors.HexColor('#CA6826'),
-            alignment=TA_CENTER,
-            spaceAfter=20
-        )
-        
-        # Section heading style
-        self.section_heading_style = ParagraphStyle(
-            'SectionHeading',
-            parent=self.styles['Heading3'],
-            fontSize=12,
-            textColor=colors.HexColor('#CA6826'),
-            spaceBefore=10,
-            spaceAfter=6
-        )
-        
-        # Normal text style
-        self.normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#2E3440')
-        )
-        
-        # Right aligned style
-        self.right_align_style = ParagraphStyle(
-            'RightAlign',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#2E3440'),
-            alignment=TA_RIGHT
-        )
+        # Company details markup is fixed for this generator, so format it once
+        self._company_details_text = f"""
+        {self.company_info['address']}<br/>
+        Phone: {self.company_info['phone']} | Email: {self.company_info['email']}<br/>
+        GSTIN: {self.company_info['gstin']}
+        """
     
-    def generate_invoice_pdf(self, invoice_data, filename=None):
-        """Generate PDF invoice"""
-        if not filename:
-            filename = f"invoice_{invoice_data['invoice_number']}.pdf"
+    def generate_invoice_pdf(self, invoice_data, filename=None, as_bytes=False):
+        """Generate PDF invoice, returning its filename or, with as_bytes, the PDF content"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import mm
+        from reportlab.platypus import SimpleDocTemplate
+        
+        if as_bytes:
+            # Build in memory for callers that send the PDF straight out, skipping the disk
+            target = io.BytesIO()
+        else:
+            if not filename:
+                filename = f"invoice_{invoice_data['invoice_number']}.pdf"
+            target = filename
         
         # Create PDF document
         doc = SimpleDocTemplate(
-            filename,
+            target,
             pagesize=A4,
             rightMargin=20*mm,
             leftMargin=20*mm,
@@ -118,23 +268,36 @@ class InvoicePDFGenerator:
         
         # Build PDF
         doc.build(story)
+        if as_bytes:
+            return target.getvalue()
         return filename
     
+    def generate_invoice_pdfs(self, invoices, output_dir='.', max_workers=None):
+        """Generate PDFs for many invoices across worker processes, returning their filenames"""
+        # Layout is CPU-bound Python, so processes rather than threads get past the GIL
+        jobs = [
+            (self.company_info, invoice_data, os.path.join(output_dir, f"invoice_{invoice_data['invoice_number']}.pdf"))
+            for invoice_data in invoices
+        ]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # Chunks of invoices per task keep pickling round-trips down on large batches
+            return list(pool.map(_generate_pdf_worker, jobs, chunksize=8))
+    
     def _create_company_header(self):
         """Create company header section"""
+        from reportlab.lib.units import mm
+        from reportlab.platypus import Paragraph, Spacer
+        styles = _pdf_styles()
+        
         content = []
         
         # Company name
-        company_name = Paragraph(self.company_info['name'], self.company_name_style)
+        company_name = Paragraph(self.company_info['name'], styles.company_name_style)
         content.append(company_name)
         
-        # Company details
-        details_text = f"""
-        {self.company_info['address']}<br/>
-        Phone: {self.company_info['phone']} | Email: {self.company_info['email']}<br/>
-        GSTIN: {self.company_info['gstin']}
-        """
-        company_details = Paragraph(details_text, self.company_details_style)
+        # Company details; flowables themselves are not shared because
+        # reportlab keeps layout state on them and PDFs build in parallel threads
+        company_details = Paragraph(self._company_details_text, styles.company_details_style)
         content.append(company_details)
         
         # Separator line
@@ -144,10 +307,14 @@ class InvoicePDFGenerator:
     
     def _create_invoice_header(self, invoice_data):
         """Create invoice header with number and date"""
+        from reportlab.lib.units import inch, mm
+        from reportlab.platypus import Paragraph, Spacer, Table
+        styles = _pdf_styles()
+        
         content = []
         
         # Invoice title
-        invoice_title = Paragraph("INVOICE", self.invoice_title_style)
+        invoice_title = Paragraph("INVOICE", styles.invoice_title_style)
         content.append(invoice_title)
         
         # Invoice details table
@@ -161,14 +328,7 @@ class InvoicePDFGenerator:
             colWidths=[3*inch, 3*inch]
         )
         
-        invoice_details_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2E3440')),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
+        invoice_details_table.setStyle(styles.invoice_details_style)
         
         content.append(invoice_details_table)
         content.append(Spacer(1, 10*mm))
@@ -177,10 +337,14 @@ class InvoicePDFGenerator:
     
     def _create_customer_section(self, invoice_data):
         """Create customer information section"""
+        from reportlab.lib.units import mm
+        from reportlab.platypus import Paragraph, Spacer
+        styles = _pdf_styles()
+        
         content = []
         
         # Bill to section
-        bill_to_heading = Paragraph("Bill To:", self.section_heading_style)
+        bill_to_heading = Paragraph("Bill To:", styles.section_heading_style)
         content.append(bill_to_heading)
         
         customer_info = f"""
@@ -189,7 +353,7 @@ class InvoicePDFGenerator:
         Phone: {invoice_data['customer_phone']}
         """
         
-        customer_paragraph = Paragraph(customer_info, self.normal_style)
+        customer_paragraph = Paragraph(customer_info, styles.normal_style)
         content.append(customer_paragraph)
         content.append(Spacer(1, 8*mm))
         
@@ -197,22 +361,21 @@ class InvoicePDFGenerator:
     
     def _create_items_table(self, invoice_data):
         """Create items table"""
+        from reportlab.lib.units import inch, mm
+        from reportlab.platypus import Spacer, Table
+        styles = _pdf_styles()
+        
         content = []
         
-        # Table header
-        table_data = [
-            ['S.No.', 'Product Name', 'Quantity', 'Unit Price (₹)', 'Total (₹)']
-        ]
+        # Local alias so each cell calls the bound formatter without a global lookup
+        money = _format_rupees
         
-        # Add items
-        for i, item in enumerate(invoice_data['items'], 1):
-            table_data.append([
-                str(i),
-                item['product_name'],
-                str(item['quantity']),
-                f"₹{item['unit_price']:,.2f}",
-                f"₹{item['total_price']:,.2f}"
-            ])
+        # Table header, then one row per item; tuples are enough since reportlab only reads the rows
+        table_data = [_ITEMS_HEADER]
+        table_data.extend(
+            (str(i), item.product_name, str(item.quantity), money(item.unit_price), money(item.total_price))
+            for i, item in enumerate(invoice_data['items'], 1)
+        )
         
         # Create table
         items_table = Table(
@@ -221,34 +384,7 @@ class InvoicePDFGenerator:
         )
         
         # Table styling
-        items_table.setStyle(TableStyle([
-            # Header styling
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5E81AC')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 0), (-1, 0), 12),
-            
-            # Data styling
-            ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # S.No.
-            ('ALIGN', (1, 1), (1, -1), 'LEFT'),    # Product name
-            ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Quantity
-            ('ALIGN', (3, 1), (3, -1), 'RIGHT'),   # Unit price
-            ('ALIGN', (4, 1), (4, -1), 'RIGHT'),   # Total
-            
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#2E3440')),
-            
-            # Grid and borders
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#D8DEE9')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F8F9FA')]),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-            ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ]))
+        items_table.setStyle(styles.items_table_style)
         
         content.append(items_table)
         content.append(Spacer(1, 8*mm))
@@ -257,13 +393,17 @@ class InvoicePDFGenerator:
     
     def _create_totals_section(self, invoice_data):
         """Create totals section"""
+        from reportlab.lib.units import inch, mm
+        from reportlab.platypus import Spacer, Table
+        styles = _pdf_styles()
+        
         content = []
         
         # Totals table data (no GST since included in prices)
         totals_data = [
-            ['Subtotal:', f"₹{invoice_data['subtotal']:,.2f}"],
-            ['', ''],  # Empty row for spacing
-            ['Total Amount:', f"₹{invoice_data['total_amount']:,.2f}"]
+            ('Subtotal:', _format_rupees(invoice_data['subtotal'])),
+            _EMPTY_ROW,  # Empty row for spacing
+            ('Total Amount:', _format_rupees(invoice_data['total_amount']))
         ]
         
         # Create totals table
@@ -274,26 +414,7 @@ class InvoicePDFGenerator:
         )
         
         # Totals table styling
-        totals_table.setStyle(TableStyle([
-            # Regular rows
-            ('ALIGN', (0, 0), (0, 2), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, 2), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 2), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, 2), 10),
-            ('TEXTCOLOR', (0, 0), (-1, 2), colors.HexColor('#2E3440')),
-            ('BOTTOMPADDING', (0, 0), (-1, 2), 4),
-            
-            # Total row styling
-            ('ALIGN', (0, 4), (-1, 4), 'RIGHT'),
-            ('FONTNAME', (0, 4), (-1, 4), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 4), (-1, 4), 12),
-            ('TEXTCOLOR', (0, 4), (-1, 4), colors.HexColor('#5E81AC')),
-            ('TOPPADDING', (0, 4), (-1, 4), 8),
-            ('BOTTOMPADDING', (0, 4), (-1, 4), 8),
-            
-            # Border for total row
-            ('LINEABOVE', (0, 4), (-1, 4), 2, colors.HexColor('#5E81AC')),
-        ]))
+        totals_table.setStyle(styles.totals_table_style)
         
         content.append(totals_table)
         content.append(Spacer(1, 15*mm))
@@ -302,44 +423,32 @@ class InvoicePDFGenerator:
     
     def _create_footer(self):
         """Create invoice footer"""
+        from reportlab.platypus import Paragraph
+        styles = _pdf_styles()
+        
         content = []
         
         # Thank you message
-        thank_you_style = ParagraphStyle(
-            'ThankYou',
-            parent=self.styles['Normal'],
-            fontSize=12,
-            textColor=colors.HexColor('#5E81AC'),
-            alignment=TA_CENTER,
-            spaceBefore=10,
-            spaceAfter=10
-        )
-        
-        thank_you = Paragraph("Thank you for your business!", thank_you_style)
+        thank_you = Paragraph("Thank you for your business!", styles.thank_you_style)
         content.append(thank_you)
         
         # Terms and conditions
-        terms_style = ParagraphStyle(
-            'Terms',
-            parent=self.styles['Normal'],
-            fontSize=8,
-            textColor=colors.HexColor('#4C566A'),
-            alignment=TA_CENTER
-        )
-        
         terms_text = """
         Terms & Conditions: Payment is due within 30 days. 
         Late payments may incur additional charges.
         """
         
-        terms = Paragraph(terms_text, terms_style)
+        terms = Paragraph(terms_text, styles.terms_style)
         content.append(terms)
         
         return content
 
 if __name__ == "__main__":
+    from invoice_calculator import InvoiceCalculator
+    
     # Test PDF generation
     pdf_generator = InvoicePDFGenerator()
+    calculator = InvoiceCalculator()
     
     # Sample invoice data
     sample_invoice = {
@@ -350,16 +459,12 @@ if __name__ == "__main__":
         'date': '2024-10-20',
         'time': '14:30:00',
         'items': [
-            {'product_name': 'Laptop', 'quantity': 1, 'unit_price': 45000.00, 'total_price': 45000.00},
-            {'product_name': 'Mouse', 'quantity': 2, 'unit_price': 500.00, 'total_price': 1000.00},
-            {'product_name': 'Keyboard', 'quantity': 1, 'unit_price': 1500.00, 'total_price': 1500.00}
+            calculator.create_invoice_item('Laptop', 1, 45000.00),
+            calculator.create_invoice_item('Mouse', 2, 500.00),
+            calculator.create_invoice_item('Keyboard', 1, 1500.00)
         ],
         'subtotal': 47500.00,
-        'cgst_rate': 9.0,
-        'sgst_rate': 9.0,
-        'cgst_amount': 4275.00,
-        'sgst_amount': 4275.00,
-        'total_amount': 56050.00
+        'total_amount': 47500.00
     }
     
     # Generate PDF
@@ -1,42 +1,168 @@
 import sqlite3
 import csv
+import io
 import os
+import queue
+import shutil
+import threading
+from contextlib import nullcontext
 from datetime import datetime
+from operator import itemgetter
+
+def _parse_int(value):
+    """Parse a CSV integer field, treating a blank field as 0"""
+    try:
+        return int(value)
+    except ValueError:
+        if value.strip():
+            raise
+        return 0
+
+def _parse_float(value):
+    """Parse a CSV decimal field, treating a blank field as 0.0"""
+    try:
+        return float(value)
+    except ValueError:
+        if value.strip():
+            raise
+        return 0.0
 
 class DatabaseRebuilderV2:
-    def __init__(self, db_name="invoice_system.db", csv_file="db.csv"):
+    # Number of rows passed to each executemany() call
+    BATCH_SIZE = 1000
+    
+    # Maximum number of parsed batches waiting to be inserted
+    QUEUE_DEPTH = 4
+    
+    # Read the CSV in 1 MiB chunks rather than the default 8 KiB
+    READ_BUFFER_SIZE = 1 << 20
+    
+    # CSV headers for product, weight, quantity, cost price and selling price, in that order
+    CSV_COLUMNS = ("Product", "Weight", "Quantity", "Cost Price", "Selling Price")
+    
+    # Loadable SQLite extension providing the csv virtual table
+    CSV_EXTENSION = "csv"
+    
+    # Page size for newly created databases (SQLite defaults to 4 KiB)
+    PAGE_SIZE = 8192
+    
+    # Connection tuning for the one-shot bulk load: WAL journal, fewer fsyncs, bigger page cache
+    CONNECTION_PRAGMAS = '''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-65536;
+        PRAGMA mmap_size=268435456;
+    '''
+    
+    def __init__(self, db_name="invoice_system.db", csv_file="db.csv", csv_stream=None):
         self.db_name = db_name
         self.csv_file = csv_file
+        # Binary file-like object to import from instead of csv_file, e.g. an upload stream
+        self.csv_stream = csv_stream
+    
+    def _open_conn(self, db_name, page_size=None):
+        """Open a connection to the staging database with bulk-load PRAGMAs applied"""
+        conn = sqlite3.connect(db_name)
+        if page_size:
+            # Must run before anything is written and before WAL is enabled, or it is ignored
+            conn.execute(f'PRAGMA page_size={int(page_size)}')
+        conn.executescript(self.CONNECTION_PRAGMAS)
+        return conn
         
-    def backup_old_database(self):
-        """Backup existing database"""
+    def _lock_live_database(self):
+        """Take an exclusive lock on the live database, proving no other connection has it open.
+        
+        Raises sqlite3.OperationalError ("database is locked") if one does. The WAL is folded
+        into the main file and switched off, so no -wal/-shm files outlive the swap and pair
+        with the rebuilt database. Returns the connection holding the lock.
+        """
+        conn = sqlite3.connect(self.db_name, timeout=0, isolation_level=None)
+        try:
+            # Set before the first read so the lock is kept after each transaction and the
+            # connection never maps the shared-memory file other connections would use
+            conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+            conn.execute("BEGIN EXCLUSIVE")
+            conn.execute("COMMIT")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA journal_mode=DELETE")
+        except BaseException:
+            conn.close()
+            raise
+        # Left behind by the connections that have since closed; nothing maps it any more
+        if os.path.exists(f"{self.db_name}-shm"):
+            os.remove(f"{self.db_name}-shm")
+        return conn
+    
+    def _backup_old_database(self):
+        """Backup existing database, leaving the original in place.
+        
+        Must only run while _lock_live_database holds db_name: the hard link shares its
+        file with any connection still open on it.
+        """
         if os.path.exists(self.db_name):
             backup_name = f"{self.db_name}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            os.rename(self.db_name, backup_name)
+            if os.path.exists(backup_name):
+                # A backup from the same second; replace it as os.rename used to
+                os.remove(backup_name)
+            try:
+                # A hard link is an instant metadata-only backup; with no connection left to
+                # write to the old file and the rebuilt one replacing its path right afterwards,
+                # the backup keeps the old contents
+                os.link(self.db_name, backup_name)
+            except OSError:
+                # Filesystem without hard link support
+                shutil.copy2(self.db_name, backup_name)
             print(f"Existing database backed up to: {backup_name}")
+    
+    def _swap_in_database(self, staging_name):
+        """Back up the live database and atomically replace it with the rebuilt staging file"""
+        if not os.path.exists(self.db_name):
+            os.replace(staging_name, self.db_name)
+            return
         
-    def create_new_database(self):
-        """Create new database with updated schema for distinct product-weight combinations"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        lock = self._lock_live_database()
+        try:
+            self._backup_old_database()
+            os.replace(staging_name, self.db_name)
+        finally:
+            lock.close()
+    
+    def _remove_database_files(self, db_name):
+        """Delete a database file along with any WAL/shared-memory side files"""
+        for path in (db_name, f"{db_name}-wal", f"{db_name}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
         
-        # Create products table - each product-weight combination is a separate record
-        cursor.execute('''
+    def _create_schema(self, conn):
+        """Create the schema for distinct product-weight combinations in the new database"""
+        # Create all tables in one script, inside a single transaction
+        conn.executescript('''
+            BEGIN;
+            
+            -- Products table - each product-weight combination is a separate record.
+            -- Uniqueness of full_product_name is enforced by an index built after the import.
             CREATE TABLE products (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 product_name TEXT NOT NULL,
                 weight TEXT,
-                full_product_name TEXT UNIQUE NOT NULL,
+                full_product_name TEXT NOT NULL,
                 quantity INTEGER NOT NULL DEFAULT 0,
                 cost_price REAL NOT NULL DEFAULT 0,
                 selling_price REAL NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create invoices table
-        cursor.execute('''
+            );
+            
+            -- Customers table, one row per customer name
+            CREATE TABLE customers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                phone TEXT,
+                address TEXT
+            );
+            
+            -- Invoices table
             CREATE TABLE invoices (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 invoice_number TEXT UNIQUE NOT NULL,
@@ -47,12 +173,12 @@ class DatabaseRebuilderV2:
                 cgst_amount REAL NOT NULL,
                 sgst_amount REAL NOT NULL,
                 total_amount REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create invoice_items table with weight column
-        cursor.execute('''
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                customer_id INTEGER,
+                FOREIGN KEY (customer_id) REFERENCES customers (id)
+            );
+            
+            -- Invoice items table with weight column
             CREATE TABLE invoice_items (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 invoice_id INTEGER NOT NULL,
@@ -61,101 +187,295 @@ class DatabaseRebuilderV2:
                 quantity INTEGER NOT NULL,
                 unit_price REAL NOT NULL,
                 total_price REAL NOT NULL,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
+                product_id INTEGER,
+                FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+                FOREIGN KEY (product_id) REFERENCES products (id)
+            );
+            
+            -- Indexes for the invoice joins and report date filters, matching DatabaseManager
+            CREATE INDEX idx_items_invoice_id ON invoice_items(invoice_id);
+            CREATE INDEX idx_items_product_name ON invoice_items(product_name);
+            CREATE INDEX idx_items_product_id ON invoice_items(product_id);
+            CREATE INDEX idx_invoices_created_at ON invoices(created_at);
+            CREATE INDEX idx_invoices_customer_id ON invoices(customer_id);
+            
+            COMMIT;
         ''')
         
-        conn.commit()
-        conn.close()
         print("New database schema created successfully!")
     
-    def import_csv_data(self):
+    def _import_csv_data(self, conn):
         """Import data from CSV file - each product-weight combination as separate record"""
-        if not os.path.exists(self.csv_file):
+        if self.csv_stream is None and not os.path.exists(self.csv_file):
             print(f"CSV file {self.csv_file} not found!")
             return False
         
-        conn = sqlite3.connect(self.db_name)
+        # Manage the transaction ourselves so the whole import is one write transaction
+        conn.isolation_level = None
         cursor = conn.cursor()
         
         imported_count = 0
         skipped_count = 0
         
+        insert_sql = '''
+            INSERT INTO products (product_name, weight, full_product_name, quantity, cost_price, selling_price)
+            VALUES (?, ?, ?, ?, ?, ?)
+        '''
+        samples = []
+        
         try:
-            with open(self.csv_file, 'r', encoding='utf-8-sig') as file:
-                csv_reader = csv.DictReader(file)
-                
-                print(f"CSV columns: {csv_reader.fieldnames}")
+            # The connection context manager commits on success and rolls back on any error
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
                 
-                for row in csv_reader:
-                    # Skip empty rows
-                    if not row['Product'].strip():
-                        skipped_count += 1
-                        continue
+                with self._open_csv() as file:
+                    csv_reader = csv.reader(file)
+                    header = next(csv_reader, [])
                     
-                    product_name = row['Product'].strip()
-                    weight = row['Weight'].strip() if row['Weight'] else ''
-                    quantity = int(row['Quantity']) if row['Quantity'].strip() else 0
-                    cost_price = float(row['Cost Price']) if row['Cost Price'].strip() else 0.0
-                    selling_price = float(row['Selling Price']) if row['Selling Price'].strip() else 0.0
+                    print(f"CSV columns: {header}")
                     
-                    # Create full product name (product + weight combination)
-                    if weight:
-                        full_product_name = f"{product_name} ({weight})"
-                    else:
-                        full_product_name = product_name
-                    
-                    # Skip if essential data is missing
-                    if not product_name or selling_price <= 0:
-                        skipped_count += 1
-                        continue
+                    # Resolve column positions once; itemgetter then pulls all five fields in one C call
+                    positions = tuple(header.index(column) for column in self.CSV_COLUMNS)
+                    select_columns = itemgetter(*positions)
+                    parse_int, parse_float = _parse_int, _parse_float
                     
-                    try:
-                        cursor.execute('''
-                            INSERT INTO products (product_name, weight, full_product_name, quantity, cost_price, selling_price)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (product_name, weight, full_product_name, quantity, cost_price, selling_price))
-                        imported_count += 1
+                    # Let SQLite parse the file itself when its csv extension is available;
+                    # it needs a path on disk, so streams are always parsed in Python
+                    extension_counts = None
+                    if self.csv_stream is None:
+                        extension_counts = self._import_with_csv_extension(conn, len(header), positions)
+                    if extension_counts is not None:
+                        imported_count, skipped_count = extension_counts
+                    else:
+                        # Parse on a worker thread while this thread, the only one touching the
+                        # connection, inserts finished batches; sqlite3 releases the GIL while it writes
+                        batches = queue.Queue(maxsize=self.QUEUE_DEPTH)
+                        stop_parsing = threading.Event()
+                        parse_errors = []
                         
-                        if imported_count <= 5:
-                            print(f"Imported: {full_product_name} - Qty: {quantity}, Price: ₹{selling_price}")
+                        def parse_rows():
+                            """Clean and deduplicate CSV rows, queueing them in BATCH_SIZE batches"""
+                            nonlocal skipped_count
+                            seen = set()
+                            batch = []
+                            try:
+                                for row in csv_reader:
+                                    # Ignore blank lines, as DictReader did
+                                    if not row:
+                                        continue
+                                    
+                                    product_name, weight, quantity, cost_price, selling_price = select_columns(row)
+                                    product_name = product_name.strip()
+                                    
+                                    # Skip empty rows
+                                    if not product_name:
+                                        skipped_count += 1
+                                        continue
+                                    
+                                    # int()/float() accept surrounding whitespace, so numbers are parsed unstripped
+                                    weight = weight.strip()
+                                    quantity = parse_int(quantity)
+                                    cost_price = parse_float(cost_price)
+                                    selling_price = parse_float(selling_price)
+                                    
+                                    # Create full product name (product + weight combination)
+                                    if weight:
+                                        full_product_name = f"{product_name} ({weight})"
+                                    else:
+                                        full_product_name = product_name
+                                    
+                                    # Skip if essential data is missing
+                                    if not product_name or selling_price <= 0:
+                                        skipped_count += 1
+                                        continue
+                                    
+                                    # Skip duplicates, keeping the first occurrence
+                                    if full_product_name in seen:
+                                        skipped_count += 1
+                                        continue
+                                    seen.add(full_product_name)
+                                    
+                                    batch.append((product_name, weight, full_product_name, quantity, cost_price, selling_price))
+                                    if len(samples) < 5:
+                                        samples.append(f"{full_product_name} - Qty: {quantity}, Price: ₹{selling_price}")
+                                    if len(batch) >= self.BATCH_SIZE:
+                                        if stop_parsing.is_set():
+                                            return
+                                        batches.put(batch)
+                                        batch = []
+                                
+                                if batch:
+                                    batches.put(batch)
+                            except Exception as e:
+                                parse_errors.append(e)
+                            finally:
+                                # Always signal the end of input so the consumer loop terminates
+                                batches.put(None)
                         
-                    except sqlite3.IntegrityError:
-                        # Skip duplicates
-                        skipped_count += 1
-                        if imported_count <= 10:
-                            print(f"Skipped duplicate: {full_product_name}")
-                
-                conn.commit()
-                print(f"\nData import completed!")
-                print(f"Products imported: {imported_count}")
-                print(f"Rows skipped: {skipped_count}")
-                return True
-                
+                        parser = threading.Thread(target=parse_rows, daemon=True)
+                        parser.start()
+                        try:
+                            for batch in iter(batches.get, None):
+                                cursor.executemany(insert_sql, batch)
+                                imported_count += len(batch)
+                        except Exception:
+                            # Stop the parser and drain the queue so it is never left blocked on put()
+                            stop_parsing.set()
+                            for _ in iter(batches.get, None):
+                                pass
+                            raise
+                        finally:
+                            parser.join()
+                        
+                        if parse_errors:
+                            raise parse_errors[0]
+                    
+                    # Build the indexes once over the loaded rows instead of maintaining them per insert
+                    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_products_fpn ON products(full_product_name)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_name_weight ON products(product_name, weight)')
+            
+            for sample in samples:
+                print(f"Imported: {sample}")
+            print(f"\nData import completed!")
+            print(f"Products imported: {imported_count}")
+            print(f"Rows skipped: {skipped_count}")
+            return True
+            
         except Exception as e:
             print(f"Error importing data: {str(e)}")
-            conn.rollback()
             return False
+    
+    def _open_csv(self):
+        """Open the CSV source as text, from csv_stream if given, otherwise csv_file"""
+        if self.csv_stream is not None:
+            return io.TextIOWrapper(self.csv_stream, encoding='utf-8-sig', newline='')
+        return open(self.csv_file, 'r', encoding='utf-8-sig', newline='', buffering=self.READ_BUFFER_SIZE)
+    
+    def _import_with_csv_extension(self, conn, column_count, positions):
+        """Bulk load products through SQLite's csv virtual table.
+        
+        Returns (imported_count, skipped_count), or None when the csv extension
+        cannot be loaded so the caller falls back to parsing rows in Python.
+        """
+        try:
+            conn.enable_load_extension(True)
+        except (AttributeError, sqlite3.OperationalError):
+            # sqlite3 built without extension support
+            return None
+        try:
+            conn.load_extension(self.CSV_EXTENSION)
+        except sqlite3.OperationalError:
+            # The csv extension is not installed
+            return None
         finally:
-            conn.close()
+            # Never leave extension loading switched on for the rest of the import
+            conn.enable_load_extension(False)
+        
+        columns = ', '.join(f"c{i}" for i in range(column_count))
+        filename = self.csv_file.replace("'", "''")
+        
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE temp.csv_import USING csv(
+                filename='{filename}', header=YES, schema='CREATE TABLE x({columns})'
+            )
+        ''')
+        try:
+            return self._insert_from_csv_table(conn, positions)
+        finally:
+            conn.execute('DROP TABLE temp.csv_import')
     
-    def verify_import(self):
-        """Verify the imported data"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def _insert_from_csv_table(self, conn, positions):
+        """Insert products from temp.csv_import, whose columns c0, c1, ... hold the raw CSV fields.
+        
+        Applies the Python path's cleaning rules, except that text fields are stripped of
+        ASCII whitespace only. Numbers go through _parse_int/_parse_float, so a bad value
+        aborts the import exactly as it does there. Returns (imported_count, skipped_count).
+        """
+        i_product, i_weight, i_quantity, i_cost, i_selling = (f"c{i}" for i in positions)
+        # A blank line reads as one empty field; csv.reader yields no fields for it
+        blank_line = "c0 = '' AND c1 IS NULL"
+        whitespace = "' ' || char(9, 10, 11, 12, 13, 28, 29, 30, 31)"
+        
+        # Rows too short to reach every column make the Python path fail on the lookup
+        row_count, short_rows = conn.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(c{max(positions)} IS NULL), 0)
+            FROM temp.csv_import
+            WHERE NOT ({blank_line})
+        ''').fetchone()
+        if short_rows:
+            raise ValueError(f"{short_rows} CSV row(s) have fewer columns than the header")
         
-        cursor.execute('SELECT COUNT(*) FROM products')
-        total_products = cursor.fetchone()[0]
+        # Keep the parser's own exception, which SQLite would otherwise reduce to a generic error
+        parse_errors = []
         
-        cursor.execute('SELECT COUNT(*) FROM products WHERE weight IS NOT NULL AND weight != ""')
-        products_with_weight = cursor.fetchone()[0]
+        def reporting(parse):
+            def parse_field(value):
+                try:
+                    return parse(value)
+                except ValueError as e:
+                    parse_errors.append(e)
+                    raise
+            return parse_field
         
-        cursor.execute('SELECT COUNT(*) FROM products WHERE cost_price > 0')
-        products_with_cost = cursor.fetchone()[0]
+        conn.create_function('parse_int', 1, reporting(_parse_int), deterministic=True)
+        conn.create_function('parse_float', 1, reporting(_parse_float), deterministic=True)
         
-        # Count unique base product names
-        cursor.execute('SELECT COUNT(DISTINCT product_name) FROM products')
-        unique_base_products = cursor.fetchone()[0]
+        # Numbers are only parsed for named rows, as the Python path skips unnamed ones first;
+        # duplicates keep their first occurrence. Rows go in in file order, as the Python path
+        # inserts them, so both give each product the same id; the window would otherwise
+        # emit them grouped by name
+        try:
+            cursor = conn.execute(f'''
+                INSERT INTO products (product_name, weight, full_product_name, quantity, cost_price, selling_price)
+                SELECT product_name, weight, full_product_name, quantity, cost_price, selling_price
+                FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY full_product_name ORDER BY row_id) AS occurrence
+                    FROM (
+                        SELECT row_id, product_name, weight,
+                               CASE WHEN weight <> '' THEN product_name || ' (' || weight || ')'
+                                    ELSE product_name END AS full_product_name,
+                               quantity, cost_price, selling_price
+                        FROM (
+                            SELECT rowid AS row_id, product_name, weight,
+                                   CASE WHEN product_name <> '' THEN parse_int({i_quantity}) END AS quantity,
+                                   CASE WHEN product_name <> '' THEN parse_float({i_cost}) END AS cost_price,
+                                   CASE WHEN product_name <> '' THEN parse_float({i_selling}) END AS selling_price
+                            FROM (
+                                SELECT rowid, {i_quantity}, {i_cost}, {i_selling},
+                                       trim({i_product}, {whitespace}) AS product_name,
+                                       trim({i_weight}, {whitespace}) AS weight
+                                FROM temp.csv_import
+                                WHERE NOT ({blank_line})
+                            )
+                        )
+                        WHERE product_name <> '' AND selling_price > 0
+                    )
+                )
+                WHERE occurrence = 1
+                ORDER BY row_id
+            ''')
+        except sqlite3.OperationalError:
+            if parse_errors:
+                raise parse_errors[0] from None
+            raise
+        imported_count = cursor.rowcount
+        
+        # Every non-blank row is either imported or skipped, as counted by the Python path
+        return imported_count, row_count - imported_count
+    
+    def _verify_import(self, conn):
+        """Verify the imported data"""
+        cursor = conn.cursor()
+        
+        # Gather all verification counts in a single scan of products
+        cursor.execute('''
+            SELECT COUNT(*),
+                   COALESCE(SUM(CASE WHEN weight IS NOT NULL AND weight != '' THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN cost_price > 0 THEN 1 ELSE 0 END), 0),
+                   COUNT(DISTINCT product_name)
+            FROM products
+        ''')
+        total_products, products_with_weight, products_with_cost, unique_base_products = cursor.fetchone()
         
         print(f"\n=== IMPORT VERIFICATION ===")
         print(f"Total product records in database: {total_products}")
@@ -163,14 +483,32 @@ class DatabaseRebuilderV2:
         print(f"Products with weight information: {products_with_weight}")
         print(f"Products with cost price: {products_with_cost}")
         
-        # Show sample products by base product name
+        # Fetch the sample products and the multi-variant product counts in one statement
         cursor.execute('''
-            SELECT product_name, weight, full_product_name, quantity, cost_price, selling_price 
-            FROM products 
-            ORDER BY product_name, weight 
-            LIMIT 10
+            SELECT * FROM (
+                SELECT 'sample' AS kind, product_name, weight, full_product_name, quantity,
+                       cost_price, selling_price, NULL AS variant_count
+                FROM products 
+                ORDER BY product_name, weight 
+                LIMIT 10
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'variant' AS kind, product_name, NULL, NULL, NULL, NULL, NULL, COUNT(*) AS variant_count
+                FROM products 
+                GROUP BY product_name 
+                HAVING COUNT(*) > 1
+                ORDER BY variant_count DESC
+                LIMIT 5
+            )
         ''')
-        sample_products = cursor.fetchall()
+        sample_products = []
+        multi_variant_products = []
+        for row in cursor.fetchall():
+            if row[0] == 'sample':
+                sample_products.append(row[1:7])
+            else:
+                multi_variant_products.append((row[1], row[7]))
         
         print(f"\n=== SAMPLE PRODUCTS ===")
         current_base_product = ""
@@ -180,42 +518,65 @@ class DatabaseRebuilderV2:
                 print(f"\n{current_base_product}:")
             print(f"  {product[2]} - Qty: {product[3]}, Cost: ₹{product[4]}, Selling: ₹{product[5]}")
         
-        # Show product count by base name
-        cursor.execute('''
-            SELECT product_name, COUNT(*) as variant_count
-            FROM products 
-            GROUP BY product_name 
-            HAVING COUNT(*) > 1
-            ORDER BY variant_count DESC
-            LIMIT 5
-        ''')
-        multi_variant_products = cursor.fetchall()
-        
         print(f"\n=== PRODUCTS WITH MULTIPLE SIZES/WEIGHTS ===")
         for product, count in multi_variant_products:
             print(f"{product}: {count} variants")
-        
-        conn.close()
     
-    def rebuild_database(self):
-        """Complete database rebuild process"""
+    def rebuild_database(self, swap_guard=None):
+        """Complete database rebuild process.
+        
+        swap_guard is a context manager held across the backup and swap of db_name;
+        callers with connections open on it pass one that closes them all on entry and
+        lets them reopen on exit, since a WAL connection left open on the old file pairs
+        its -wal/-shm files with the wrong database once the rebuilt one takes its path.
+        If any connection is still open at that point the rebuild fails instead.
+        """
         print("=== STARTING DATABASE REBUILD V2 (PRODUCT-WEIGHT COMBINATIONS) ===")
         
-        # Step 1: Backup existing database
-        self.backup_old_database()
+        # Build into a staging file so the live database stays intact until the rebuild succeeds
+        staging_name = f"{self.db_name}.rebuild"
+        self._remove_database_files(staging_name)
         
-        # Step 2: Create new database
-        self.create_new_database()
+        try:
+            # Steps 1-3 share one connection so the page cache and PRAGMAs carry over
+            conn = self._open_conn(staging_name, page_size=self.PAGE_SIZE)
+            try:
+                # Step 1: Create new database
+                self._create_schema(conn)
+                
+                # Step 2: Import CSV data
+                success = self._import_csv_data(conn)
+                if success:
+                    # Step 3: Verify import
+                    self._verify_import(conn)
+            finally:
+                # Closing the last connection checkpoints the WAL back into the staging file
+                conn.close()
+        except BaseException:
+            # e.g. a disk or I/O error while building; never leave a half-built staging file behind
+            self._remove_database_files(staging_name)
+            raise
         
-        # Step 3: Import CSV data
-        if self.import_csv_data():
-            # Step 4: Verify import
-            self.verify_import()
+        if success:
+            # Step 4: With no connection left on the live database, back it up and
+            # atomically swap the rebuilt one into place
+            try:
+                with swap_guard or nullcontext():
+                    self._swap_in_database(staging_name)
+            except sqlite3.OperationalError as e:
+                # Another connection, e.g. a running app, still has the live database open
+                print(f"Live database is still in use, leaving it untouched: {str(e)}")
+                success = False
+        
+        if success:
             print("\n=== DATABASE REBUILD V2 COMPLETED SUCCESSFULLY! ===")
             print("\nNow each product-weight combination is stored as a separate inventory item.")
             print("This allows proper tracking of different sizes/weights of the same product.")
         else:
+            self._remove_database_files(staging_name)
             print("\n=== DATABASE REBUILD V2 FAILED! ===")
+        
+        return success
 
 if __name__ == "__main__":
     rebuilder = DatabaseRebuilderV2()
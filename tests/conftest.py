@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The application modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def manager(tmp_path):
+    """A DatabaseManager on a fresh database in a temporary directory"""
+    from database import DatabaseManager
+    return DatabaseManager(db_name=str(tmp_path / "invoice_system.db"))
+
+@pytest.fixture
+def client(manager, tmp_path, monkeypatch):
+    """A logged-in Flask test client whose routes use the temporary database"""
+    # Importing app opens its default database and creates runtime directories in the
+    # working directory, so keep those apart from the manager's database
+    workdir = tmp_path / "app"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    import app as app_module
+    monkeypatch.setattr(app_module, "db_manager", manager)
+
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+        yield client
@@ -0,0 +1,135 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+CSV_DATA = (
+    "Product,Weight,Quantity,Cost Price,Selling Price\n"
+    "Rice,1kg,10,40,50\n"
+    "Rice,5kg,4,190,240\n"
+    "Dal,500g,7,45,60\n"
+).encode()
+
+def _upload(client):
+    return client.post(
+        "/api/database/upload",
+        data={"csvFile": (io.BytesIO(CSV_DATA), "stock.csv")},
+        content_type="multipart/form-data",
+    )
+
+def _integrity(conn):
+    return conn.execute("PRAGMA integrity_check").fetchone()[0]
+
+def test_upload_with_connection_held_keeps_database_intact(client, manager):
+    manager.add_product("Old stock", 3, 10.0)
+    # Leave idle connections in the pool as well
+    manager.get_all_products()
+
+    checked_out = threading.Event()
+    holder_errors = []
+
+    def hold_connection():
+        """Keep a pooled connection checked out until the upload starts draining the pool"""
+        conn = manager._get_connection()
+        try:
+            conn.execute("SELECT COUNT(*) FROM products").fetchone()
+            checked_out.set()
+            deadline = time.monotonic() + 10
+            while not manager._pool_paused and time.monotonic() < deadline:
+                time.sleep(0.01)
+            conn.execute("SELECT COUNT(*) FROM products").fetchone()
+        except sqlite3.Error as e:
+            holder_errors.append(e)
+        finally:
+            manager._return_connection(conn)
+
+    holder = threading.Thread(target=hold_connection)
+    holder.start()
+    checked_out.wait(5)
+    try:
+        response = _upload(client)
+    finally:
+        holder.join()
+
+    assert response.get_json()["success"] is True
+    assert holder_errors == []
+
+    conn = manager._get_connection()
+    try:
+        assert _integrity(conn) == "ok"
+    finally:
+        manager._return_connection(conn)
+
+    direct = sqlite3.connect(manager.db_name)
+    try:
+        assert _integrity(direct) == "ok"
+    finally:
+        direct.close()
+
+    names = [product["full_product_name"] for product in manager.get_all_products()]
+    assert names == ["Dal (500g)", "Rice (1kg)", "Rice (5kg)"]
+
+def test_pause_connections_migrates_a_swapped_in_file_before_resuming(manager, tmp_path):
+    bare = tmp_path / "bare.db"
+    conn = sqlite3.connect(str(bare))
+    conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, full_product_name TEXT)")
+    conn.close()
+
+    with manager.pause_connections():
+        os.replace(str(bare), manager.db_name)
+
+    # The first checkout after the pause already sees the app's full schema
+    conn = manager._get_connection()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+    finally:
+        manager._return_connection(conn)
+
+def test_pause_connections_times_out_while_a_connection_is_held(manager):
+    conn = manager._get_connection()
+    try:
+        with pytest.raises(TimeoutError):
+            with manager.pause_connections(timeout=0.1):
+                pass
+    finally:
+        manager._return_connection(conn)
+
+    # The pause is lifted again, so connections can still be checked out
+    assert manager.get_product("missing") is None
+
+def test_rebuild_leaves_database_in_use_untouched(manager, tmp_path):
+    from rebuild_database_v2 import DatabaseRebuilderV2
+
+    manager.add_product("Old stock", 3, 10.0)
+    csv_path = tmp_path / "stock.csv"
+    csv_path.write_bytes(CSV_DATA)
+
+    # An open connection the swap cannot drain, e.g. from another process
+    outside = sqlite3.connect(manager.db_name)
+    try:
+        outside.execute("SELECT COUNT(*) FROM products").fetchone()
+        rebuilder = DatabaseRebuilderV2(db_name=manager.db_name, csv_file=str(csv_path))
+        assert rebuilder.rebuild_database(swap_guard=manager.pause_connections()) is False
+        assert _integrity(outside) == "ok"
+    finally:
+        outside.close()
+
+    assert [product["full_product_name"] for product in manager.get_all_products()] == ["Old stock"]
+    assert not (tmp_path / "invoice_system.db.rebuild").exists()
+
+def test_rebuild_removes_staging_files_when_the_build_raises(manager, tmp_path, monkeypatch):
+    from rebuild_database_v2 import DatabaseRebuilderV2
+
+    def fail(self, conn):
+        conn.execute("CREATE TABLE partial (x)")
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(DatabaseRebuilderV2, "_create_schema", fail)
+    rebuilder = DatabaseRebuilderV2(db_name=manager.db_name, csv_stream=io.BytesIO(CSV_DATA))
+    with pytest.raises(sqlite3.OperationalError):
+        rebuilder.rebuild_database(swap_guard=manager.pause_connections())
+
+    assert [path.name for path in tmp_path.iterdir() if ".rebuild" in path.name] == []